@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+import pipeline
+
+FAIXAS_PDF = ["00 a 18", "19 a 23", "24 a 28", "29 a 33", "34 a 38", "39 a 43", "44 a 48", "49 a 53", "54 a 58", "59 ou +"]
+PRODUTOS = ["Essencial", "Ideal", "Superior", "Premium", "Executivo", "Master"]
+CIDADES = ["Belo Horizonte", "Contagem", "Betim", "Nova Lima", "Sete Lagoas", "Uberlândia"]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text_ops(lines: List[str], x: int = 40, y: int = 800, size: int = 9, leading: int = 12) -> List[str]:
+    return [f"BT /F1 {size} Tf {x} {y - i * leading} Td ({_escape(line)}) Tj ET" for i, line in enumerate(lines)]
+
+
+def _grid_ops(title: str, rows: List[List[str]], x0: int = 40, y0: int = 770, col_width: int = 105,
+              row_height: int = 16) -> List[str]:
+    ops = _text_ops([title], x=x0, y=y0 + 12, size=11)
+    for r, row in enumerate(rows):
+        y = y0 - (r + 1) * row_height
+        for c, cell in enumerate(row):
+            ops.append(f"BT /F1 8 Tf {x0 + c * col_width + 3} {y + 4} Td ({_escape(cell)}) Tj ET")
+    width = len(rows[0]) * col_width
+    for r in range(len(rows) + 1):
+        ops.append(f"{x0} {y0 - r * row_height} m {x0 + width} {y0 - r * row_height} l S")
+    for c in range(len(rows[0]) + 1):
+        ops.append(f"{x0 + c * col_width} {y0} m {x0 + c * col_width} {y0 - len(rows) * row_height} l S")
+    return ops
+
+
+def _brl(value: float) -> str:
+    return "R$ " + f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>", None]
+    kids = []
+    for ops in pages:
+        data = " ".join(ops).encode("cp1252", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return out
+
+
+def synthetic_health_plan_pdf(price_pages: int = 4, copart_pages: int = 1, network_pages: int = 2,
+                              ruled: bool = True, seed: int = 0, revised_page: int = None) -> bytes:
+    rng = random.Random(seed)
+    pages = [_text_ops([
+        "Operadora Saúde Sintética S.A. - Tabela de Vendas",
+        "Vigência: 01/04/2025 a 31/03/2026 - Regional Minas Gerais",
+        "Planos PME de 02 a 29 vidas e 30 a 99 vidas",
+    ])]
+    for p in range(price_pages):
+        segmento = "02 a 29 vidas" if p % 2 == 0 else "30 a 99 vidas"
+        produtos = rng.sample(PRODUTOS, 3)
+        header = ["Faixa Etária"] + [f"{produto} {acomodacao}" for produto, acomodacao in
+                                      zip(produtos, ["Enfermaria", "Apartamento", "Enfermaria"])]
+        base = [rng.uniform(150, 450) * (1.08 if p == revised_page else 1) for _ in produtos]
+        rows = [header] + [
+            [faixa] + [_brl(b * (1.18 ** i)) for b in base] for i, faixa in enumerate(FAIXAS_PDF)
+        ]
+        title = f"Tabela de Preços PME {segmento}"
+        if ruled:
+            pages.append(_grid_ops(title, rows))
+        else:
+            pages.append(_text_ops([title] + ["   ".join(row) for row in rows]))
+    for _ in range(copart_pages):
+        pages.append(_text_ops([
+            "Coparticipação",
+            f"Consultas eletivas {_brl(rng.uniform(20, 60))}",
+            f"Urgência e emergência {_brl(rng.uniform(60, 120))}",
+            f"Exames simples 30% limitado a {_brl(rng.uniform(40, 150))} por exame",
+            f"Exames complexos 30% limitado a {_brl(rng.uniform(150, 300))}",
+            f"Terapias {_brl(rng.uniform(20, 60))} por sessão",
+            f"Internação {_brl(rng.uniform(150, 400))} por evento",
+            f"Taxa de cadastro {_brl(15)} por vida",
+        ]))
+    for p in range(network_pages):
+        lines = ["Rede Credenciada - Hospitais, Clínicas e Laboratórios"]
+        for i in range(30):
+            kind = rng.choice(["Hospital", "Clínica", "Laboratório", "Pronto Atendimento"])
+            lines.append(f"{kind} {rng.choice(['Santa', 'São', 'Nossa'])} {p * 30 + i} - "
+                         f"Rua {rng.randint(1, 999)} - {rng.choice(CIDADES)} - Tel (31) 3{rng.randint(100, 999)}-{rng.randint(1000, 9999)}")
+        pages.append(_text_ops(lines, size=8, leading=11))
+    return build_pdf(pages)
+
+
+def canned_completion(prompt: str) -> Dict:
+    pages = [int(n) for n in re.findall(r"=== PÁGINA (\d+) ===", prompt)] or [1]
+    if "CABEÇALHO" in prompt:
+        return {
+            "empresa": "Saúde Sintética S.A.",
+            "tipo_documento": "tabela_de_vendas",
+            "regional": "Minas Gerais",
+            "vigencia": {"inicio": "2025-04-01", "fim": "2026-03-31"},
+        }
+    if "VALORES e PLANOS" in prompt:
+        return {
+            "empresa": "Saúde Sintética S.A.",
+            "tipo_documento": "tabela_de_vendas",
+            "regional": "Minas Gerais",
+            "vigencia": {"inicio": "2025-04-01", "fim": "2026-03-31"},
+            "planos_precos": [
+                {
+                    "id": f"p{page}-{i}",
+                    "produto": f"Plano {i} página {page}",
+                    "tabela_origem": f"tabela_{page}",
+                    "posicao_na_pagina": str(page),
+                    "segmentacao": "02_29_vidas",
+                    "acomodacao": "Enfermaria",
+                    "valores_faixas": {faixa: _brl(100 + 25 * j + i) for j, faixa in enumerate(pipeline.FAIXAS_ETARIAS)},
+                }
+                for page in pages for i in range(3)
+            ],
+        }
+    if "COPARTICIPAÇÕES" in prompt:
+        return {"tabelas_valores": [{
+            "id": "copart-1",
+            "tabela_origem": f"coparticipacao_pagina_{pages[0]}",
+            "posicao_na_pagina": str(pages[0]),
+            "tipo": "coparticipacao_ambulatorial",
+            "valores": {"consulta_eletiva": "R$ 40,00", "exames_simples": "30% limitado a R$ 80,00"},
+        }]}
+    cidades = [
+        (page, cidade) for page, text in pipeline.split_pages(prompt)
+        for cidade in re.findall(r" - ([A-ZÀ-Ú][\wÀ-ú ]+) - Tel", text)
+    ]
+    return {"informacoes_gerais": [{
+        "tipo": "hospitais_ou_clinicas_ou_laboratorios_ou_outros",
+        "categoria": "rede_credenciada",
+        "regiao": "Minas Gerais",
+        "lista": [
+            {"nome": f"Estabelecimento {page}-{i}", "cidade": cidade, "posicao_na_pagina": str(page)}
+            for i, (page, cidade) in enumerate(cidades)
+        ],
+    }]}
+
+
+class MockOpenRouter:
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 2000.0, port: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/api/v1/chat/completions"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with mock.lock:
+                    mock.requests += 1
+                prompt = body["messages"][0]["content"]
+                content = json.dumps(canned_completion(prompt), ensure_ascii=False)
+                usage = {"prompt_tokens": pipeline.estimate_tokens(prompt), "completion_tokens": pipeline.estimate_tokens(content)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                generation = usage["completion_tokens"] / mock.tokens_per_second
+                time.sleep(mock.latency)
+                if not body.get("stream"):
+                    time.sleep(generation)
+                    data = json.dumps({"choices": [{"message": {"content": content}}], "usage": usage}).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                parts = [content[i:i + 64] for i in range(0, len(content), 64)]
+                for part in parts:
+                    time.sleep(generation / len(parts))
+                    event = {"choices": [{"delta": {"content": part}}]}
+                    self._send_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self._send_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+                self._send_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(args) -> Dict:
+    pipeline.tracer = pipeline.Tracer(spans_path=None, metrics_path=None)
+    documents = [
+        synthetic_health_plan_pdf(args.paginas_preco, args.paginas_copart, args.paginas_rede,
+                                  ruled=not args.sem_grade, seed=i)
+        for i in range(args.documentos)
+    ]
+    latencies, tokens = [], []
+    with MockOpenRouter(args.latencia, args.tokens_por_segundo) as mock:
+        extractor = pipeline.PDFExtractorAgents(
+            "benchmark",
+            max_workers=args.max_requests,
+            cache=pipeline.ResultCache(db_path=None, memory_items=0),
+            chunk_tokens=args.chunk_tokens,
+            base_url=mock.url,
+            table_fast_path=not args.llm_only,
+            route_tokens=None if args.no_routing else pipeline.ROUTING_TOKEN_BUDGET,
+            streaming=not args.no_stream,
+            model_router=pipeline.ModelRouter(args.modelos, stats_path=None),
+            store=pipeline.ResultStore(db_path=None),
+        )
+
+        def process(index: int, pdf_bytes: bytes, previous: Dict = None, label: str = "bench") -> Dict:
+            trace_id = f"{label}-{index}"
+            started = time.perf_counter()
+            result = extractor.process_pdf_completo(pdf_bytes, trace_id=trace_id, previous=previous)
+            elapsed = time.perf_counter() - started
+            spans = [s for s in pipeline.tracer.spans_for(trace_id) if s["stage"] == "api_call"]
+            return {
+                "segundos": elapsed,
+                "tokens": sum((s.get("prompt_tokens") or 0) + (s.get("completion_tokens") or 0) for s in spans),
+                "planos": len(result.get("planos_precos", [])),
+                "resultado": result,
+            }
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+            outcomes = list(executor.map(process, range(args.documentos), documents))
+        wall = time.perf_counter() - started
+        api_requests = mock.requests
+
+        revision = None
+        if args.revisao:
+            revised = [
+                synthetic_health_plan_pdf(args.paginas_preco, args.paginas_copart, args.paginas_rede,
+                                          ruled=not args.sem_grade, seed=i, revised_page=0)
+                for i in range(args.documentos)
+            ]
+            with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+                revised_outcomes = list(executor.map(
+                    process, range(args.documentos), revised, [o["resultado"] for o in outcomes],
+                    ["revisao"] * args.documentos
+                ))
+            revision = {
+                "latencia_p50": round(float(np.percentile([o["segundos"] for o in revised_outcomes], 50)), 4),
+                "tokens_por_documento": round(float(np.mean([o["tokens"] for o in revised_outcomes])), 1),
+                "requisicoes_api": mock.requests - api_requests,
+                "paginas_reprocessadas": round(float(np.mean([
+                    len(o["resultado"]["alteracoes"]["paginas_reprocessadas"]) for o in revised_outcomes
+                ])), 1),
+            }
+
+    latencies = np.array([o["segundos"] for o in outcomes])
+    tokens = np.array([o["tokens"] for o in outcomes])
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "documentos": args.documentos,
+        "paginas_por_documento": 1 + args.paginas_preco + args.paginas_copart + args.paginas_rede,
+        "segundos_total": round(wall, 4),
+        "documentos_por_segundo": round(args.documentos / wall, 4),
+        "latencia_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latencia_p95": round(float(np.percentile(latencies, 95)), 4),
+        "latencia_max": round(float(latencies.max()), 4),
+        "tokens_por_documento": round(float(tokens.mean()), 1),
+        "requisicoes_api": api_requests,
+        "planos_por_documento": round(float(np.mean([o["planos"] for o in outcomes])), 1),
+        "pico_rss_mb": round(peak_rss_mb(), 1),
+        "pico_rss_filhos_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "etapas": {
+            stage: round(seconds, 4) for stage, seconds in sorted(pipeline.tracer.stage_seconds.items())
+        },
+        "revisao_incremental": revision,
+        "modelos": extractor.model_router.snapshot()["modelos"],
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline process_pdf_completo com PDFs sintéticos e LLM simulado.")
+    parser.add_argument("--documentos", type=int, default=10)
+    parser.add_argument("--paginas-preco", type=int, default=4)
+    parser.add_argument("--paginas-copart", type=int, default=1)
+    parser.add_argument("--paginas-rede", type=int, default=2)
+    parser.add_argument("--sem-grade", action="store_true", help="gera tabelas de preço sem linhas de grade")
+    parser.add_argument("--latencia", type=float, default=0.5, help="latência fixa simulada por requisição (s)")
+    parser.add_argument("--tokens-por-segundo", type=float, default=2000.0, help="velocidade simulada de geração")
+    parser.add_argument("--concorrencia", type=int, default=1, help="documentos processados em paralelo")
+    parser.add_argument("--max-requests", type=int, default=pipeline.MAX_CONCURRENT_AGENTS)
+    parser.add_argument("--chunk-tokens", type=int, default=0)
+    parser.add_argument("--llm-only", action="store_true")
+    parser.add_argument("--no-routing", action="store_true")
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--modelos", default=pipeline.MODEL_ROUTING_PATH, help="política de modelos por agente (JSON)")
+    parser.add_argument("--revisao", action="store_true",
+                        help="reprocessa cada documento com uma página de preços reajustada no modo incremental")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
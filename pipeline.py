@@ -0,0 +1,2815 @@
+import pandas as pd
+import numpy as np
+import json
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+import pdfplumber
+import io
+import re
+from typing import Dict, List, Any
+import time
+import argparse
+import logging
+import random
+import os
+import hashlib
+import importlib.util
+import pickle
+import unicodedata
+import shutil
+import tempfile
+import sqlite3
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+OPENROUTER_API_KEY = ""
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+logger = logging.getLogger("pdftojson")
+MAX_CONCURRENT_AGENTS = 3
+MAX_PARALLEL_REQUESTS = 16
+CHUNK_TOKEN_BUDGET = 12000
+ROUTING_TOKEN_BUDGET = 32000
+ROUTING_RELATIVE_SCORE = 0.25
+ML_KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml_knowledge_base.pkl")
+PDF_PAGES_PER_TASK = 8
+PDF_EXTRACT_PROCESSES = os.cpu_count() or 1
+OCR_PROCESSES = PDF_EXTRACT_PROCESSES
+OCR_TASKS_PER_CHILD = 8
+OCR_PAGES_PER_TASK = 4
+OCR_DPI = 300
+OCR_LANG = "por"
+OCR_PAGE_TIMEOUT = 120
+OCR_MIN_CHARS = 40
+OCR_TESSERACT_CMD = os.environ.get("TESSERACT_CMD", "tesseract")
+PAGE_MARKER_RE = re.compile(r"\n=== PÁGINA (\d+) ===\n")
+
+HTTP_POOL_SIZE = 10
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 600
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 1.0
+HTTP_BACKOFF_MAX = 60.0
+HTTP_RETRY_STATUS = {429, 500, 502, 503, 504}
+API_REQUESTS_PER_MINUTE = 60
+
+
+class RateLimiter:
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 6))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiter = RateLimiter(API_REQUESTS_PER_MINUTE)
+
+DEFAULT_MODEL = "qwen/qwen3-30b-a3b-instruct-2507"
+DEFAULT_MAX_TOKENS = 32768
+DEFAULT_TEMPERATURE = 0.1
+PROMPT_VERSIONS = {"valores": 1, "cabecalho": 1, "coparticipacao": 2, "rede": 2}
+
+CACHE_DIR = "cache"
+CACHE_DB_PATH = os.path.join(CACHE_DIR, "pdftojson_cache.sqlite")
+CACHE_MEMORY_ITEMS = 128
+CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+
+def content_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, db_path: str = CACHE_DB_PATH, memory_items: int = CACHE_MEMORY_ITEMS,
+                 max_disk_bytes: int = CACHE_MAX_DISK_BYTES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {}
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _count(self, namespace: str, field: str):
+        counters = self.stats.setdefault(namespace, {"hits_memoria": 0, "hits_disco": 0, "misses": 0})
+        counters[field] += 1
+
+    def get(self, namespace: str, key: str):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get((namespace, key))
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self.memory.move_to_end((namespace, key))
+                self._count(namespace, "hits_memoria")
+                return json.loads(entry[1])
+            self.memory.pop((namespace, key), None)
+            row = None
+            if self.db_path:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+                        (namespace, key)
+                    ).fetchone()
+                    if row is not None and now - row[1] > self.ttl_seconds:
+                        conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+                        row = None
+                    elif row is not None:
+                        conn.execute(
+                            "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                            (now, namespace, key)
+                        )
+            if row is None:
+                self._count(namespace, "misses")
+                return None
+            self._remember(namespace, key, row[0], row[1])
+            self._count(namespace, "hits_disco")
+            return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self._remember(namespace, key, data, now)
+            if not self.db_path:
+                return
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, size, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, key, data, len(data.encode("utf-8")), now, now)
+                )
+                self._evict(conn, now)
+
+    def _remember(self, namespace: str, key: str, data: str, created: float):
+        self.memory[(namespace, key)] = (created, data)
+        self.memory.move_to_end((namespace, key))
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for namespace, key, size in conn.execute(
+            "SELECT namespace, key, size FROM cache ORDER BY accessed"
+        ).fetchall():
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+LOGS_DIR = "logs"
+APP_LOG_PATH = os.path.join(LOGS_DIR, "app.log")
+SPANS_LOG_PATH = os.path.join(LOGS_DIR, "spans.jsonl")
+METRICS_PROM_PATH = os.path.join(LOGS_DIR, "metrics.prom")
+METRICS_PORT = int(os.environ.get("PDFTOJSON_METRICS_PORT", "0"))
+TRACE_MEMORY_SPANS = 5000
+
+
+class Tracer:
+    def __init__(self, spans_path: str = SPANS_LOG_PATH, metrics_path: str = METRICS_PROM_PATH,
+                 memory_spans: int = TRACE_MEMORY_SPANS):
+        self.spans_path = spans_path
+        self.metrics_path = metrics_path
+        self.recent = deque(maxlen=memory_spans)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stage_counts = {}
+        self.stage_seconds = {}
+        self.counters = {}
+
+    @property
+    def trace_id(self) -> str:
+        return getattr(self.local, "trace_id", None)
+
+    def bind(self, trace_id: str):
+        self.local.trace_id = trace_id
+
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        started_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            record = {
+                "trace_id": self.trace_id,
+                "stage": stage,
+                "inicio": started_at,
+                "segundos": round(time.perf_counter() - started, 6),
+                "thread": threading.current_thread().name,
+                **attributes,
+            }
+            if error:
+                record["erro"] = error
+            self._record(record)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self, stage: str, seconds: float, **attributes):
+        self._record({
+            "trace_id": self.trace_id,
+            "stage": stage,
+            "inicio": time.time() - seconds,
+            "segundos": round(seconds, 6),
+            "thread": threading.current_thread().name,
+            **attributes,
+        })
+
+    def _record(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.recent.append(record)
+            self.stage_counts[record["stage"]] = self.stage_counts.get(record["stage"], 0) + 1
+            self.stage_seconds[record["stage"]] = self.stage_seconds.get(record["stage"], 0.0) + record["segundos"]
+            if self.spans_path:
+                os.makedirs(os.path.dirname(self.spans_path) or ".", exist_ok=True)
+                with open(self.spans_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def spans_for(self, trace_id: str) -> List[Dict]:
+        with self.lock:
+            return [span for span in self.recent if span.get("trace_id") == trace_id]
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP pdftojson_stage_seconds_total Tempo acumulado por etapa do pipeline.",
+            "# TYPE pdftojson_stage_seconds_total counter",
+        ]
+        with self.lock:
+            lines += [f'pdftojson_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                      for stage, seconds in sorted(self.stage_seconds.items())]
+            lines += [
+                "# HELP pdftojson_stage_calls_total Execuções por etapa do pipeline.",
+                "# TYPE pdftojson_stage_calls_total counter",
+            ]
+            lines += [f'pdftojson_stage_calls_total{{stage="{stage}"}} {count}'
+                      for stage, count in sorted(self.stage_counts.items())]
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE pdftojson_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"pdftojson_{name}_total{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        if not self.metrics_path:
+            return
+        os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+        tmp_path = self.metrics_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.metrics_path)
+
+    def serve_prometheus(self, port: int) -> ThreadingHTTPServer:
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+        return server
+
+
+tracer = Tracer()
+
+
+def setup_logging():
+    if any(getattr(h, "baseFilename", None) == os.path.abspath(APP_LOG_PATH) for h in logger.handlers):
+        return
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    handler = logging.FileHandler(APP_LOG_PATH, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(threadName)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def _pdf_stream(pdf_source):
+    return io.BytesIO(pdf_source) if isinstance(pdf_source, (bytes, bytearray)) else pdf_source
+
+
+@contextmanager
+def _pdf_file(pdf_source):
+    if isinstance(pdf_source, str):
+        yield pdf_source
+        return
+    if not isinstance(pdf_source, (bytes, bytearray)):
+        pdf_source.seek(0)
+        pdf_source = pdf_source.read()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_source)
+        yield path
+    finally:
+        os.remove(path)
+
+
+FAIXAS_ETARIAS = ["00-18", "19-23", "24-28", "29-33", "34-38", "39-43", "44-48", "49-53", "54-58", "59+"]
+FAIXA_RANGE_RE = re.compile(r"^(\d{1,2})\s*(?:-|–|a|à|até)\s*(\d{1,2})(?:\s*anos)?$")
+FAIXA_OPEN_RE = re.compile(r"^(\d{1,2})\s*(?:\+|anos\s*ou\s*mais|ou\s*mais|ou\s*\+|anos\s*\+|\+\s*anos)$")
+PRICE_CELL_RE = re.compile(r"^(?:R\$\s*)?\d{1,3}(?:\.\d{3})*,\d{2}$")
+SEGMENTACAO_RE = re.compile(r"(\d{1,2})\s*(?:a|-|à|até)\s*(\d{2,3})\s*vidas", re.IGNORECASE)
+
+
+def normalize_faixa(cell) -> str:
+    text = re.sub(r"\s+", " ", str(cell or "")).strip().lower()
+    match = FAIXA_RANGE_RE.match(text)
+    if match:
+        faixa = f"{int(match.group(1)):02d}-{int(match.group(2)):02d}"
+        return faixa if faixa in FAIXAS_ETARIAS else ""
+    match = FAIXA_OPEN_RE.match(text)
+    if match and int(match.group(1)) == 59:
+        return "59+"
+    return ""
+
+
+def _clean_cell(cell) -> str:
+    return re.sub(r"\s+", " ", str(cell or "")).strip()
+
+
+def _has_age_band_table(tables: List) -> bool:
+    return any(
+        sum(1 for row in table for cell in row if normalize_faixa(cell)) >= len(FAIXAS_ETARIAS) - 2
+        for table in tables
+    )
+
+
+def _iter_page_range(pdf_source, start: int, end: int, with_tables: bool = False):
+    with pdfplumber.open(_pdf_stream(pdf_source)) as pdf:
+        for index in range(start, end):
+            page = pdf.pages[index]
+            page_text = page.extract_text(x_tolerance=1, y_tolerance=1) or ""
+            if not with_tables:
+                page.close()
+                yield index + 1, page_text
+                continue
+            tables = page.extract_tables()
+            if not _has_age_band_table(tables) and len({normalize_faixa(m) for m in re.findall(
+                    r"\b\d{1,2}\s*(?:-|a|à|até)\s*\d{1,2}\b|\b59\s*\+", page_text)} - {""}) >= len(FAIXAS_ETARIAS) - 2:
+                tables = page.extract_tables({"vertical_strategy": "text", "horizontal_strategy": "text"})
+            page.close()
+            yield index + 1, page_text, tables
+
+
+def _extract_page_range(pdf_source, start: int, end: int, with_tables: bool = False) -> List[tuple]:
+    return list(_iter_page_range(pdf_source, start, end, with_tables))
+
+
+def iter_pdf_pages(pdf_source, processes: int = PDF_EXTRACT_PROCESSES, pages_per_task: int = PDF_PAGES_PER_TASK,
+                   with_tables: bool = False):
+    with pdfplumber.open(_pdf_stream(pdf_source)) as pdf:
+        page_count = len(pdf.pages)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    if processes <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from _iter_page_range(pdf_source, start, end, with_tables)
+        return
+    with _pdf_file(pdf_source) as pdf_path, ProcessPoolExecutor(max_workers=min(processes, len(ranges))) as pool:
+        futures = [pool.submit(_extract_page_range, pdf_path, start, end, with_tables) for start, end in ranges]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_available() -> bool:
+    return importlib.util.find_spec("pytesseract") is not None and shutil.which(OCR_TESSERACT_CMD) is not None
+
+
+def _page_image_hashes(pdf_source, page_numbers: List[int]) -> Dict[int, str]:
+    hashes = {}
+    with pdfplumber.open(_pdf_stream(pdf_source)) as pdf:
+        for page_num in page_numbers:
+            page = pdf.pages[page_num - 1]
+            digest = hashlib.sha256(f"{OCR_LANG}|{OCR_DPI}|{page.width}x{page.height}".encode("utf-8"))
+            streams = [image.get("stream") for image in page.images]
+            for stream in streams:
+                if stream is not None:
+                    digest.update(stream.get_rawdata() or b"")
+            page.close()
+            if streams:
+                hashes[page_num] = digest.hexdigest()
+    return hashes
+
+
+def _ocr_worker_init():
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_page_range(pdf_source, page_numbers: List[int], dpi: int = OCR_DPI, lang: str = OCR_LANG,
+                    timeout: float = OCR_PAGE_TIMEOUT) -> List[tuple]:
+    import pypdfium2
+    import pytesseract
+    
+    pytesseract.pytesseract.tesseract_cmd = OCR_TESSERACT_CMD
+    results = []
+    pdf = pypdfium2.PdfDocument(pdf_source)
+    try:
+        for page_num in page_numbers:
+            started = time.perf_counter()
+            try:
+                page = pdf[page_num - 1]
+                image = page.render(scale=dpi / 72, grayscale=True).to_pil()
+                page.close()
+                rendered = time.perf_counter()
+                try:
+                    text = pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+                finally:
+                    image.close()
+            except Exception as e:
+                results.append((page_num, None, {"erro": str(e)}))
+                continue
+            results.append((page_num, text, {
+                "render": round(rendered - started, 6), "ocr": round(time.perf_counter() - rendered, 6)
+            }))
+    finally:
+        pdf.close()
+    return results
+
+
+def iter_ocr_pages(pdf_source, page_numbers: List[int], processes: int = OCR_PROCESSES,
+                   pages_per_task: int = OCR_PAGES_PER_TASK):
+    if processes <= 1 or len(page_numbers) <= 1:
+        for page_num in page_numbers:
+            try:
+                yield from _ocr_page_range(pdf_source, [page_num])
+            except Exception as e:
+                yield page_num, None, {"erro": str(e)}
+        return
+    with _pdf_file(pdf_source) as pdf_path:
+        batch_size = processes * OCR_TASKS_PER_CHILD * pages_per_task
+        for start in range(0, len(page_numbers), batch_size):
+            batch = page_numbers[start:start + batch_size]
+            tasks = [batch[i:i + pages_per_task] for i in range(0, len(batch), pages_per_task)]
+            with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=_ocr_worker_init) as pool:
+                futures = {pool.submit(_ocr_page_range, pdf_path, task): task for task in tasks}
+                try:
+                    for future in as_completed(futures):
+                        try:
+                            yield from future.result()
+                        except Exception as e:
+                            for page_num in futures[future]:
+                                yield page_num, None, {"erro": str(e)}
+                finally:
+                    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _plano_from_label(label: str, valores: Dict[str, str], page_num: int, table_index: int, page_text: str) -> Dict:
+    lowered = label.lower()
+    if "apart" in lowered:
+        acomodacao = "Apartamento"
+    elif "enferm" in lowered:
+        acomodacao = "Enfermaria"
+    else:
+        acomodacao = "Nenhum"
+    if "ambulat" in lowered and "hosp" not in lowered:
+        tipo = "Ambulatorial"
+    elif "obst" in lowered:
+        tipo = "Amb_Hosp_Obst"
+    elif "hosp" in lowered or acomodacao != "Nenhum":
+        tipo = "Hospitalar"
+    else:
+        tipo = ""
+    segmentacao = SEGMENTACAO_RE.search(label) or SEGMENTACAO_RE.search(page_text)
+    categoria = next((c for c in ("MEI", "PME", "ADESAO", "PJ")
+                      if re.search(rf"\b{c}\b", page_text.upper().replace("ADESÃO", "ADESAO"))), "")
+    registro = re.search(r"\b(\d{6}\d?-?\d?)\b", label)
+    return {
+        "id": str(uuid.UUID(content_hash(f"{page_num}|{table_index}|{label}|{json.dumps(valores, sort_keys=True)}")[:32])),
+        "produto": label,
+        "tabela_origem": f"tabela_{table_index}_pagina_{page_num}",
+        "posicao_na_pagina": f"página {page_num}",
+        "empresa": "",
+        "tipo": tipo,
+        "categoria": categoria,
+        "segmentacao": f"{int(segmentacao.group(1)):02d}_{int(segmentacao.group(2)):02d}_vidas" if segmentacao else "",
+        "registro_ans": registro.group(1) if registro else "",
+        "acomodacao": acomodacao,
+        "descricao": label,
+        "valores_faixas": valores,
+        "detalhes_adicionais": "extraído deterministicamente da tabela do PDF",
+        "observacoes": ""
+    }
+
+
+def parse_price_table(table: List[List], page_num: int, table_index: int, page_text: str = "") -> tuple:
+    rows = [[_clean_cell(cell) for cell in row] for row in table if any(row)]
+    if not rows:
+        return [], True
+    planos = []
+    band_rows = [i for i, row in enumerate(rows) if row and normalize_faixa(row[0])]
+    header_cols = next((i for i, row in enumerate(rows)
+                        if sum(1 for cell in row if normalize_faixa(cell)) >= len(FAIXAS_ETARIAS) - 2), None)
+    if len(band_rows) >= len(FAIXAS_ETARIAS) - 2:
+        header = rows[:band_rows[0]]
+        width = max(len(row) for row in rows)
+        for col in range(1, width):
+            label = " ".join(row[col] for row in header if col < len(row) and row[col]).strip()
+            valores = {normalize_faixa(rows[i][0]): rows[i][col] for i in band_rows if col < len(rows[i])}
+            if any(valores.values()):
+                planos.append(_plano_from_label(label or f"coluna {col}", valores, page_num, table_index, page_text))
+    elif header_cols is not None:
+        bands = {col: normalize_faixa(cell) for col, cell in enumerate(rows[header_cols]) if normalize_faixa(cell)}
+        for row in rows[header_cols + 1:]:
+            label = " ".join(cell for col, cell in enumerate(row) if col not in bands and cell).strip()
+            valores = {faixa: row[col] for col, faixa in bands.items() if col < len(row)}
+            if any(valores.values()):
+                planos.append(_plano_from_label(label, valores, page_num, table_index, page_text))
+    else:
+        return [], True
+    complete = bool(planos) and all(
+        set(p["valores_faixas"]) == set(FAIXAS_ETARIAS)
+        and all(PRICE_CELL_RE.match(v) for v in p["valores_faixas"].values())
+        and p["produto"]
+        for p in planos
+    )
+    return planos, complete
+
+
+def parse_price_tables(page_num: int, page_text: str, tables: List) -> tuple:
+    planos = []
+    for table_index, table in enumerate(tables, 1):
+        table_planos, complete = parse_price_table(table, page_num, table_index, page_text)
+        if not complete:
+            return [], False
+        planos.extend(table_planos)
+    return planos, bool(planos)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def split_pages(pdf_text: str) -> List[tuple]:
+    parts = PAGE_MARKER_RE.split(pdf_text)
+    return [(int(parts[i]), parts[i + 1]) for i in range(1, len(parts) - 1, 2)]
+
+
+def build_chunks(pdf_text: str, token_budget: int = CHUNK_TOKEN_BUDGET) -> List[tuple]:
+    chunks = []
+    pages, text, tokens = [], "", 0
+    for page_num, page_text in split_pages(pdf_text):
+        block = f"\n=== PÁGINA {page_num} ===\n{page_text}"
+        block_tokens = estimate_tokens(block)
+        if pages and tokens + block_tokens > token_budget:
+            chunks.append((pages, text))
+            pages, text, tokens = [], "", 0
+        pages.append(page_num)
+        text += block
+        tokens += block_tokens
+    if pages:
+        chunks.append((pages, text))
+    return chunks or [([], pdf_text)]
+
+
+AGENT_KEYWORDS = {
+    "valores": [
+        "faixa etaria", "faixas etarias", "00 a 18", "0 a 18", "59 +", "59 ou mais", "r$", "mensalidade",
+        "tabela de precos", "preco", "valores", "per capita", "enfermaria", "apartamento", "vidas", "ans",
+        "vigencia", "reajuste",
+    ],
+    "coparticipacao": [
+        "coparticipacao", "copart", "consulta", "consultas eletivas", "exames", "exame", "terapia", "internacao",
+        "urgencia", "emergencia", "taxa", "taxa de cadastro", "adesao", "limitado a", "%", "franquia",
+    ],
+    "rede": [
+        "rede credenciada", "rede propria", "hospital", "hospitais", "clinica", "laboratorio", "pronto atendimento",
+        "pronto-socorro", "endereco", "rua", "av.", "avenida", "telefone", "bairro", "cidade", "credenciado",
+    ],
+}
+
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+
+
+class PageRouter:
+    def __init__(self, knowledge_base_path: str = ML_KNOWLEDGE_BASE_PATH, relative_score: float = ROUTING_RELATIVE_SCORE):
+        self.knowledge_base_path = knowledge_base_path
+        self.relative_score = relative_score
+        self._knowledge_base = None
+        self._patterns = {}
+        self._lock = threading.Lock()
+
+    @property
+    def knowledge_base(self) -> Dict:
+        if self._knowledge_base is None:
+            with self._lock:
+                if self._knowledge_base is None:
+                    try:
+                        with open(self.knowledge_base_path, "rb") as f:
+                            self._knowledge_base = pickle.load(f)
+                    except Exception as e:
+                        logger.warning("Base de conhecimento indisponível (%s): %s", self.knowledge_base_path, e)
+                        self._knowledge_base = {}
+        return self._knowledge_base
+
+    def keywords(self, agent_name: str) -> List[str]:
+        keywords = list(AGENT_KEYWORDS[agent_name])
+        if agent_name == "valores":
+            kb = self.knowledge_base
+            keywords += [term for terms in kb.get("plan_patterns", {}).values() for term in terms]
+            keywords += [term for terms in kb.get("company_patterns", {}).values() for term in terms]
+            keywords += kb.get("value_indicators", [])
+        return sorted({_fold(k) for k in keywords if k})
+
+    def _reference_text(self, agent_name: str) -> str:
+        reference = " ".join(self.keywords(agent_name))
+        if agent_name == "valores":
+            reference += " " + " ".join(
+                _fold(item.get("text", ""))[:5000]
+                for item in self.knowledge_base.get("successful_extractions", [])
+                if isinstance(item, dict)
+            )
+        return reference
+
+    def keyword_pattern(self, agent_name: str) -> re.Pattern:
+        if agent_name not in self._patterns:
+            terms = sorted(self.keywords(agent_name), key=len, reverse=True)
+            self._patterns[agent_name] = re.compile("|".join(
+                (r"\b" if k[0].isalnum() else "") + re.escape(k) + (r"\b" if k[-1].isalnum() else "") for k in terms
+            ))
+        return self._patterns[agent_name]
+
+    def score_pages(self, pages: List[tuple], agent_name: str) -> List[float]:
+        folded = [_fold(text) for _, text in pages]
+        keywords = self.keywords(agent_name)
+        pattern = self.keyword_pattern(agent_name)
+        scores = []
+        for text in folded:
+            hits = len(pattern.findall(text))
+            scores.append(float(hits / (1 + np.log1p(len(text) / 500)) / len(keywords)))
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.metrics.pairwise import cosine_similarity
+        except ImportError:
+            return scores
+        try:
+            matrix = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True).fit_transform(
+                folded + [self._reference_text(agent_name)]
+            )
+        except ValueError:
+            return scores
+        similarity = cosine_similarity(matrix[:-1], matrix[-1]).ravel()
+        return [score + float(sim) for score, sim in zip(scores, similarity)]
+
+    def route(self, pdf_text: str, agent_name: str, token_budget: int = ROUTING_TOKEN_BUDGET) -> str:
+        pages = split_pages(pdf_text)
+        if not pages:
+            return pdf_text
+        scores = self.score_pages(pages, agent_name)
+        threshold = max(scores) * self.relative_score
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score >= threshold),
+            key=lambda i: scores[i], reverse=True
+        )
+        if agent_name == "valores" and 0 not in ranked:
+            ranked.append(0)
+        selected, tokens = [], 0
+        for i in ranked:
+            page_tokens = estimate_tokens(pages[i][1])
+            if token_budget and selected and tokens + page_tokens > token_budget:
+                logger.warning("Agente %s: página %d relevante omitida pelo orçamento de tokens", agent_name, pages[i][0])
+                continue
+            selected.append(i)
+            tokens += page_tokens
+        return "".join(f"\n=== PÁGINA {pages[i][0]} ===\n{pages[i][1]}\n" for i in sorted(selected))
+
+
+_page_router = PageRouter()
+
+
+PAGE_LIST_PATTERN = r"(\d+(?:\s*(?:,|e|-|–|a|até)\s*\d+)*)"
+PAGE_CITATION_RE = re.compile(r"\bp(?:á|a)?g(?:ina)?s?\.?\s*" + PAGE_LIST_PATTERN, re.IGNORECASE)
+BARE_PAGES_RE = re.compile(r"^\s*" + PAGE_LIST_PATTERN + r"\s*$")
+PAGE_RANGE_RE = re.compile(r"(\d+)\s*(?:-|–|a|até)\s*(\d+)")
+MAX_CITED_RANGE = 500
+
+
+def _dedupe_key(item: Dict, ignore=("id", "posicao_na_pagina")) -> str:
+    return json.dumps({k: v for k, v in item.items() if k not in ignore}, sort_keys=True, ensure_ascii=False)
+
+
+def _page_citations(text: str) -> List[re.Match]:
+    return list(PAGE_CITATION_RE.finditer(text)) or list(BARE_PAGES_RE.finditer(text))
+
+
+def cited_pages(posicao) -> set:
+    pages = set()
+    for citation in _page_citations(str(posicao or "")):
+        numbers = citation.group(1)
+        pages.update(int(n) for n in re.findall(r"\d+", numbers))
+        for start, end in PAGE_RANGE_RE.findall(numbers):
+            if int(start) < int(end) <= int(start) + MAX_CITED_RANGE:
+                pages.update(range(int(start), int(end) + 1))
+    return pages
+
+
+def _fix_posicao(item: Dict, pages: List[int]) -> Dict:
+    if not pages or "posicao_na_pagina" not in item:
+        return item
+    if not cited_pages(item.get("posicao_na_pagina")) & set(pages):
+        item = dict(item)
+        item["posicao_na_pagina"] = f"página {pages[0]}" if len(pages) == 1 else f"páginas {pages[0]}-{pages[-1]}"
+    return item
+
+
+def merge_agent_results(agent_name: str, partials: List[tuple]) -> Dict:
+    if len(partials) == 1:
+        return partials[0][1]
+    merged = {}
+    if agent_name == "valores":
+        for field, default in (("empresa", "empresa_desconhecida"), ("tipo_documento", "detectado_automaticamente"),
+                               ("regional", "nao_especificada")):
+            values = [r.get(field) for _, r in partials if r.get(field) and r.get(field) != default]
+            merged[field] = values[0] if values else default
+        vigencias = [r.get("vigencia") for _, r in partials
+                     if isinstance(r.get("vigencia"), dict) and any(r["vigencia"].values())]
+        merged["vigencia"] = vigencias[0] if vigencias else {"inicio": None, "fim": None}
+    if agent_name in ("valores", "coparticipacao"):
+        field = "planos_precos" if agent_name == "valores" else "tabelas_valores"
+        seen, items = set(), []
+        for pages, r in partials:
+            for item in r.get(field, []):
+                if not isinstance(item, dict):
+                    continue
+                key = _dedupe_key(item)
+                if key not in seen:
+                    seen.add(key)
+                    items.append(_fix_posicao(item, pages))
+        merged[field] = items
+    if agent_name == "rede":
+        groups = OrderedDict()
+        for pages, r in partials:
+            for info in r.get("informacoes_gerais", []):
+                if not isinstance(info, dict):
+                    continue
+                group_key = (info.get("tipo"), info.get("categoria"), info.get("regiao"))
+                group = groups.setdefault(group_key, ({k: v for k, v in info.items() if k != "lista"}, OrderedDict()))
+                for item in info.get("lista", []):
+                    if isinstance(item, dict):
+                        group[1].setdefault((item.get("nome"), item.get("cidade")), _fix_posicao(item, pages))
+        merged["informacoes_gerais"] = [dict(header, lista=list(lista.values())) for header, lista in groups.values()]
+    return merged
+
+
+PAGE_HASHES_KEY = "hashes_paginas"
+PATCH_FIELDS = {"valores": "planos_precos", "coparticipacao": "tabelas_valores", "rede": "informacoes_gerais"}
+HEADER_FIELDS = ("empresa", "tipo_documento", "regional", "vigencia")
+
+
+def page_hashes(pdf_text: str) -> Dict[str, str]:
+    return {str(page_num): content_hash(" ".join(page_text.split()))[:16] for page_num, page_text in split_pages(pdf_text)}
+
+
+def diff_pages(previous: Dict[str, str], current: Dict[str, str]) -> Dict:
+    unmatched = {}
+    for page in sorted(previous, key=int):
+        unmatched.setdefault(previous[page], []).append(int(page))
+    pending, reused = [], 0
+    for page in sorted(current, key=int):
+        if previous.get(page) == current[page]:
+            unmatched[current[page]].remove(int(page))
+            reused += 1
+        else:
+            pending.append(int(page))
+    moved, changed = {}, []
+    for page in pending:
+        candidates = unmatched.get(current[str(page)])
+        if candidates:
+            moved[candidates.pop(0)] = page
+        else:
+            changed.append(page)
+    return {
+        "alteradas": changed,
+        "descartadas": sorted(page for pages in unmatched.values() for page in pages),
+        "movidas": moved,
+        "reaproveitadas": reused + len(moved),
+    }
+
+
+def select_pages(pdf_text: str, pages: set) -> str:
+    return "".join(f"\n=== PÁGINA {n} ===\n{t}\n" for n, t in split_pages(pdf_text) if n in pages)
+
+
+def result_items(result: Dict, field: str) -> List[Dict]:
+    items = result.get(field) or []
+    if field == "informacoes_gerais":
+        items = [item for info in items if isinstance(info, dict) for item in info.get("lista", [])]
+    return [item for item in items if isinstance(item, dict)]
+
+
+def _renumber_posicao(item: Dict, moved: Dict[int, int]) -> Dict:
+    if not moved or "posicao_na_pagina" not in item:
+        return item
+    text = str(item["posicao_na_pagina"])
+    parts, last = [], 0
+    for citation in _page_citations(text):
+        parts.append(text[last:citation.start(1)])
+        parts.append(re.sub(r"\d+", lambda m: str(moved.get(int(m.group()), m.group())), citation.group(1)))
+        last = citation.end(1)
+    item = dict(item)
+    item["posicao_na_pagina"] = "".join(parts) + text[last:]
+    return item
+
+
+def previous_partials(previous: Dict, diff: Dict) -> Dict[str, Dict]:
+    stale = set(diff["descartadas"])
+    
+    def keep(item: Dict) -> bool:
+        return not cited_pages(item.get("posicao_na_pagina")) & stale
+    
+    partials = {}
+    for agent_name, field in PATCH_FIELDS.items():
+        if any(not cited_pages(item.get("posicao_na_pagina")) for item in result_items(previous, field)):
+            partials[agent_name] = None
+            continue
+        if agent_name == "rede":
+            groups = []
+            for info in previous.get(field) or []:
+                lista = [_renumber_posicao(item, diff["movidas"]) for item in info.get("lista", []) if keep(item)]
+                if lista:
+                    groups.append(dict(info, lista=lista))
+            partials[agent_name] = {field: groups}
+        else:
+            partials[agent_name] = {
+                field: [_renumber_posicao(item, diff["movidas"]) for item in result_items(previous, field) if keep(item)]
+            }
+        if agent_name == "valores":
+            partials[agent_name].update({key: previous[key] for key in HEADER_FIELDS if key in previous})
+    return partials
+
+
+def patch_agent_result(agent_name: str, new: Dict, previous_partial: Dict) -> Dict:
+    patched = merge_agent_results(agent_name, [([], new), ([], previous_partial)])
+    field = PATCH_FIELDS[agent_name]
+    if agent_name != "rede":
+        patched[field] = sorted(patched[field], key=lambda item: min(cited_pages(item.get("posicao_na_pagina")) or {0}))
+    return patched
+
+
+def _describe_item(item: Dict) -> str:
+    return str(item.get("produto") or item.get("nome") or item.get("tabela_origem") or item.get("descricao") or "")
+
+
+def change_report(previous: Dict, result: Dict, diff: Dict, full_agents: List[str]) -> Dict:
+    report = {
+        "paginas_reprocessadas": diff["alteradas"],
+        "paginas_descartadas": diff["descartadas"],
+        "paginas_movidas": {str(old): new for old, new in diff["movidas"].items()},
+        "paginas_reaproveitadas": diff["reaproveitadas"],
+        "agentes_reprocessados_integralmente": full_agents,
+        "campos_alterados": [key for key in HEADER_FIELDS if previous.get(key) != result.get(key)],
+    }
+    for field in PATCH_FIELDS.values():
+        before = {_dedupe_key(item): item for item in result_items(previous, field)}
+        after = {_dedupe_key(item): item for item in result_items(result, field)}
+        report[field] = {
+            "adicionados": [_describe_item(item) for key, item in after.items() if key not in before],
+            "removidos": [_describe_item(item) for key, item in before.items() if key not in after],
+            "mantidos": sum(1 for key in after if key in before),
+        }
+    return report
+
+
+class OpenRouterClient:
+    def __init__(self, headers: Dict[str, str], pool_size: int = HTTP_POOL_SIZE,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT,
+                 max_retries: int = HTTP_MAX_RETRIES, rate_limiter: RateLimiter = None):
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or _rate_limiter
+
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(HTTP_BACKOFF_MAX, max(0.0, float(retry_after)))
+                except ValueError:
+                    try:
+                        delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                        return min(HTTP_BACKOFF_MAX, max(0.0, delay))
+                    except (TypeError, ValueError):
+                        pass
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+    def post(self, url: str, payload: Dict, stream: bool = False, read_timeout: float = None,
+             retry_timeouts: bool = True) -> requests.Response:
+        timeout = (self.timeout[0], read_timeout) if read_timeout else self.timeout
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or (not retry_timeouts and isinstance(e, requests.Timeout)):
+                    raise
+                time.sleep(self._retry_delay(attempt))
+            else:
+                if response.status_code not in HTTP_RETRY_STATUS or attempt >= self.max_retries:
+                    response.retry_count = attempt
+                    return response
+                delay = self._retry_delay(attempt, response)
+                try:
+                    response.content
+                except requests.RequestException:
+                    pass
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+
+MODEL_ROUTING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routing.json")
+MODEL_STATS_PATH = os.path.join(LOGS_DIR, "model_stats.json")
+MODEL_STATS_ALPHA = 0.2
+MODEL_STATS_MIN_CALLS = 3
+MODEL_FAILURE_THRESHOLD = 0.5
+MODEL_OUTPUT_MARGIN = 1.5
+MODEL_MIN_MAX_TOKENS = 2048
+
+
+class ModelRouter:
+    def __init__(self, config_path: str = MODEL_ROUTING_PATH, stats_path: str = MODEL_STATS_PATH):
+        self.config_path = config_path
+        self.stats_path = stats_path
+        self.lock = threading.Lock()
+        self.config = self._load_json(config_path)
+        stats = self._load_json(stats_path)
+        self.models = stats.get("modelos", {})
+        self.agents = stats.get("agentes", {})
+
+    def _load_json(self, path: str) -> Dict:
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Falha ao ler %s: %s", path, e)
+            return {}
+
+    def _rule(self, agent_name: str, pages: int, tokens: int) -> tuple:
+        agent = self.config.get("agentes", {}).get(agent_name, {})
+        for rule in agent.get("regras", []):
+            if pages <= rule.get("paginas_max", pages) and tokens <= rule.get("tokens_max", tokens):
+                return agent, rule
+        return agent, {}
+
+    def _setting(self, key: str, agent: Dict, rule: Dict, default=None):
+        for source in (rule, agent, self.config.get("padrao", {})):
+            if source.get(key) is not None:
+                return source[key]
+        return default
+
+    def _healthy(self, model: str, latency_limit: float = None) -> bool:
+        stats = self.models.get(model)
+        if not stats or stats["chamadas"] < MODEL_STATS_MIN_CALLS:
+            return True
+        if stats["taxa_falha"] >= MODEL_FAILURE_THRESHOLD:
+            return False
+        return not latency_limit or stats["latencia"] <= latency_limit
+
+    def routes(self, agent_name: str, pdf_text: str) -> List[Dict]:
+        pages = max(1, len(split_pages(pdf_text)))
+        agent, rule = self._rule(agent_name, pages, estimate_tokens(pdf_text))
+        models = self._setting("modelos", agent, rule, [DEFAULT_MODEL])
+        cap = self._setting("max_tokens", agent, rule, DEFAULT_MAX_TOKENS)
+        per_page = self._setting("tokens_saida_por_pagina", agent, rule, 0)
+        if per_page:
+            per_page = max(per_page, self.agents.get(agent_name, {}).get("tokens_saida_por_pagina", 0))
+        max_tokens = min(cap, max(MODEL_MIN_MAX_TOKENS, int(per_page * pages * MODEL_OUTPUT_MARGIN))) if per_page else cap
+        latency_limit = self._setting("latencia_max", agent, rule)
+        ordered = sorted(models, key=lambda model: not self._healthy(model, latency_limit))
+        return [
+            {
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": self._setting("temperature", agent, rule, DEFAULT_TEMPERATURE),
+                "read_timeout": self._setting("timeout_leitura", agent, rule),
+                "agent": agent_name,
+                "paginas": pages,
+            }
+            for model in ordered
+        ]
+
+    def record(self, route: Dict, seconds: float, outcome: str, usage: Dict):
+        with self.lock:
+            stats = self.models.setdefault(route["model"], {
+                "chamadas": 0, "falhas": 0, "timeouts": 0, "latencia": seconds, "taxa_falha": 0.0,
+                "custo_total": 0.0, "tokens_saida": 0,
+            })
+            failed = outcome != "ok"
+            stats["chamadas"] += 1
+            stats["falhas"] += failed
+            stats["timeouts"] += outcome == "timeout"
+            stats["taxa_falha"] += MODEL_STATS_ALPHA * (failed - stats["taxa_falha"])
+            if not failed:
+                stats["latencia"] += MODEL_STATS_ALPHA * (seconds - stats["latencia"])
+                stats["custo_total"] += float(usage.get("cost") or 0)
+                stats["tokens_saida"] += usage.get("completion_tokens") or 0
+                if usage.get("completion_tokens") and route.get("agent"):
+                    agent = self.agents.setdefault(route["agent"], {})
+                    observed = usage["completion_tokens"] / route["paginas"]
+                    previous = agent.get("tokens_saida_por_pagina", observed)
+                    agent["tokens_saida_por_pagina"] = previous + MODEL_STATS_ALPHA * (observed - previous)
+        tracer.count("api_seconds", seconds, model=route["model"])
+        tracer.count("api_calls", model=route["model"], outcome=outcome)
+        if usage.get("cost"):
+            tracer.count("api_cost_usd", float(usage["cost"]), model=route["model"])
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {"modelos": json.loads(json.dumps(self.models)), "agentes": json.loads(json.dumps(self.agents))}
+
+    def save(self):
+        if not self.stats_path:
+            return
+        data = self.snapshot()
+        os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+        tmp_path = f"{self.stats_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.stats_path)
+
+
+_model_router = ModelRouter()
+
+
+STREAM_ITEM_KEYS = ("planos_precos", "tabelas_valores", "informacoes_gerais", "lista")
+STREAM_HEADER_RE = re.compile(r'"(empresa|tipo_documento|regional)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def iter_sse_content(response: requests.Response, usage: Dict = None):
+    if "charset" not in response.headers.get("Content-Type", ""):
+        response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        event = json.loads(data)
+        if "error" in event:
+            raise ValueError(event["error"].get("message", str(event["error"])))
+        if usage is not None and event.get("usage"):
+            usage.update(event["usage"])
+        for choice in event.get("choices", []):
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+class StreamingJSONParser:
+    def __init__(self, item_keys=STREAM_ITEM_KEYS, on_item=None):
+        self.item_keys = set(item_keys)
+        self.on_item = on_item
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_string = None
+        self.items = {key: [] for key in item_keys}
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        text = self.text
+        for i in range(self.pos, len(text)):
+            c = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self.last_string = text[self.string_start + 1:i]
+                continue
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c == ":":
+                if self.stack and self.stack[-1][0] == "{":
+                    self.stack[-1][1] = self.last_string
+            elif c == "{":
+                in_items = bool(self.stack) and self.stack[-1][0] == "[" and self.stack[-1][1] in self.item_keys
+                self.stack.append(["{", None, i if in_items else None])
+            elif c == "[":
+                key = self.stack[-1][1] if self.stack and self.stack[-1][0] == "{" else None
+                self.stack.append(["[", key, None])
+            elif c in "}]" and self.stack:
+                frame = self.stack.pop()
+                if c == "}" and frame[2] is not None and self.stack:
+                    try:
+                        item = json.loads(text[frame[2]:i + 1])
+                    except ValueError:
+                        continue
+                    key = self.stack[-1][1]
+                    self.items[key].append(item)
+                    if self.on_item:
+                        self.on_item(key, item)
+        self.pos = len(text)
+
+    def partial_result(self) -> Dict:
+        result = {}
+        for match in STREAM_HEADER_RE.finditer(self.text):
+            try:
+                result.setdefault(match.group(1), json.loads(f'"{match.group(2)}"'))
+            except ValueError:
+                pass
+        for key in ("planos_precos", "tabelas_valores"):
+            if self.items[key]:
+                result[key] = list(self.items[key])
+        groups = list(self.items["informacoes_gerais"])
+        listed = sum(len(group.get("lista", [])) for group in groups if isinstance(group, dict))
+        orphans = self.items["lista"][listed:]
+        if orphans:
+            groups.append({"lista": orphans})
+        if groups:
+            result["informacoes_gerais"] = groups
+        return result
+
+
+AGENT_ITEM_ARRAYS = {"valores": "planos_precos", "coparticipacao": "tabelas_valores", "rede": "informacoes_gerais"}
+AGENT_ITEM_LABEL_KEYS = ("produto", "tabela_origem", "nome", "tipo")
+MAX_CONTINUATIONS = 2
+CODE_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*(?:```|$)", re.DOTALL)
+
+
+def strip_code_fences(text: str) -> str:
+    match = CODE_FENCE_RE.search(text)
+    if match:
+        text = match.group(1)
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1:
+        return text.strip()
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def remove_trailing_commas(text: str) -> str:
+    out = []
+    in_string = escape = False
+    pending_comma = None
+    for c in text:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if c.isspace():
+                pending_comma.append(c)
+                continue
+            if c not in "}]":
+                out.append(",")
+            out.extend(pending_comma)
+            pending_comma = None
+        if c == ",":
+            pending_comma = []
+            continue
+        if c == '"':
+            in_string = True
+        out.append(c)
+    if pending_comma is not None:
+        out.append(",")
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+def recover_json(text: str) -> tuple:
+    if not text or not text.strip():
+        return None, "vazio"
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, "ok"
+    except ValueError:
+        pass
+    candidate = remove_trailing_commas(strip_code_fences(text))
+    try:
+        parsed = json.loads(candidate, strict=False)
+    except ValueError:
+        return None, "invalido"
+    return (parsed, "reparado") if isinstance(parsed, dict) else (None, "invalido")
+
+
+def continuation_prompt(prompt: str, agent_name: str, partial: Dict) -> str:
+    array_key = AGENT_ITEM_ARRAYS[agent_name]
+    items = partial.get(array_key, [])
+    if agent_name == "rede":
+        items = [item for group in items if isinstance(group, dict) for item in group.get("lista", [])]
+    labels = [
+        next((str(item[k]) for k in AGENT_ITEM_LABEL_KEYS if isinstance(item, dict) and item.get(k)), f"item {i}")
+        for i, item in enumerate(items, 1)
+    ]
+    return f"""{prompt}
+
+ATENÇÃO: sua resposta anterior foi interrompida depois de {len(labels)} itens. Os itens já recebidos, em ordem, são:
+{json.dumps(labels, ensure_ascii=False)}
+
+Continue a partir do item {len(labels) + 1}. NÃO repita os itens já recebidos.
+Retorne APENAS um JSON válido com a mesma estrutura, contendo somente os itens restantes em `{array_key}`.
+"""
+
+
+_progress_local = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ProgressCallback:
+    def bind_thread(self):
+        pass
+
+    def on_start(self, agent_names: List[str]):
+        pass
+
+    def on_stage(self, message: str, percent: int):
+        pass
+
+    def on_agent_start(self, agent_name: str, message: str):
+        pass
+
+    def on_agent_item(self, agent_name: str, item_key: str, item: Dict):
+        pass
+
+    def on_agent_done(self, agent_name: str, metric_label: str, count: int, failed: bool):
+        pass
+
+    def on_error(self, message: str):
+        logger.error(message)
+
+    def on_finish(self):
+        pass
+
+    def cancelled(self) -> bool:
+        return False
+
+
+class LoggingProgress(ProgressCallback):
+    def __init__(self, label: str):
+        self.label = label
+
+    def on_agent_done(self, agent_name: str, metric_label: str, count: int, failed: bool):
+        logger.info("%s: %s %s (%s: %d)", self.label, agent_name, "falhou" if failed else "concluído", metric_label, count)
+
+    def on_error(self, message: str):
+        logger.error("%s: %s", self.label, message)
+
+
+def current_progress() -> ProgressCallback:
+    return getattr(_progress_local, "callback", None) or ProgressCallback()
+
+
+def check_cancelled():
+    if current_progress().cancelled():
+        raise JobCancelled("Extração cancelada")
+
+
+def report_error(message: str):
+    current_progress().on_error(message)
+
+
+class PDFExtractorAgents:
+    def __init__(self, api_key: str, max_workers: int = MAX_CONCURRENT_AGENTS, cache: ResultCache = None,
+                 chunk_tokens: int = 0, base_url: str = OPENROUTER_BASE_URL, table_fast_path: bool = True,
+                 route_tokens: int = None, streaming: bool = True, client: OpenRouterClient = None,
+                 model_router: ModelRouter = None, ocr: bool = True, store: "ResultStore" = None):
+        self.api_key = api_key
+        self.max_workers = max(1, max_workers)
+        self.chunk_tokens = chunk_tokens
+        self.table_fast_path = table_fast_path
+        self.route_tokens = route_tokens
+        self.streaming = streaming
+        self.ocr = ocr
+        self.parse_stats = {}
+        self.stats_lock = threading.Lock()
+        self.router = _page_router
+        self.model_router = model_router or _model_router
+        self.cache = cache or get_result_cache()
+        self.store = store or get_result_store()
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.base_url = base_url
+        self.client = client or OpenRouterClient(self.headers, pool_size=max(HTTP_POOL_SIZE, self.max_workers))
+    
+    def read_pdf_bytes(self, pdf_file) -> bytes:
+        if isinstance(pdf_file, (bytes, bytearray)):
+            return bytes(pdf_file)
+        if hasattr(pdf_file, "getvalue"):
+            return pdf_file.getvalue()
+        if hasattr(pdf_file, "read"):
+            pdf_file.seek(0)
+            return pdf_file.read()
+        with open(pdf_file, "rb") as f:
+            return f.read()
+
+    def _content_key(self, pdf_hash: str) -> str:
+        return f"{pdf_hash}|ocr" if self.ocr and ocr_available() else pdf_hash
+
+    def extract_text_from_pdf(self, pdf_file) -> str:
+        try:
+            with tracer.span("extract_text") as span:
+                return self._extract_text_from_pdf(pdf_file, span)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            report_error(f"Erro ao extrair texto do PDF: {str(e)}")
+            return ""
+
+    def _extract_text_from_pdf(self, pdf_file, span: Dict) -> str:
+        pdf_bytes = self.read_pdf_bytes(pdf_file)
+        pdf_hash = content_hash(pdf_bytes)
+        span["bytes"] = len(pdf_bytes)
+        cached = self.cache.get("pdf_text", self._content_key(pdf_hash))
+        span["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+        texts = {}
+        for page_num, page_text in iter_pdf_pages(pdf_bytes):
+            check_cancelled()
+            texts[page_num] = page_text
+        texts.update(self.ocr_pages(pdf_bytes, texts))
+        text = "".join(
+            f"\n=== PÁGINA {page_num} ===\n{page_text}\n"
+            for page_num, page_text in sorted(texts.items())
+            if page_text
+        )
+        self.cache.set("pdf_text", self._content_key(pdf_hash), text)
+        span["caracteres"] = len(text)
+        return text
+    
+    def extract_pdf_content(self, pdf_file) -> Dict:
+        try:
+            with tracer.span("extract_text", tabelas=True) as span:
+                return self._extract_pdf_content(pdf_file, span)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            report_error(f"Erro ao extrair texto do PDF: {str(e)}")
+            return {"text": "", "planos_precos": [], "paginas_resolvidas": []}
+
+    def _extract_pdf_content(self, pdf_file, span: Dict) -> Dict:
+        pdf_bytes = self.read_pdf_bytes(pdf_file)
+        pdf_hash = content_hash(pdf_bytes)
+        span["bytes"] = len(pdf_bytes)
+        cached = self.cache.get("pdf_content", self._content_key(pdf_hash))
+        span["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+        texts, planos, resolved = {}, [], []
+        for page_num, page_text, tables in iter_pdf_pages(pdf_bytes, with_tables=True):
+            check_cancelled()
+            texts[page_num] = page_text
+            page_planos, page_resolved = parse_price_tables(page_num, page_text, tables)
+            if page_resolved:
+                planos.extend(page_planos)
+                resolved.append(page_num)
+        texts.update(self.ocr_pages(pdf_bytes, texts))
+        text = "".join(
+            f"\n=== PÁGINA {page_num} ===\n{page_text}\n"
+            for page_num, page_text in sorted(texts.items())
+            if page_text
+        )
+        content = {"text": text, "planos_precos": planos, "paginas_resolvidas": resolved}
+        self.cache.set("pdf_content", self._content_key(pdf_hash), content)
+        span.update(caracteres=len(content["text"]), paginas_resolvidas=len(resolved))
+        return content
+    
+    def ocr_pages(self, pdf_bytes: bytes, page_texts: Dict[int, str]) -> Dict[int, str]:
+        page_numbers = [n for n, t in page_texts.items() if len(t.strip()) < OCR_MIN_CHARS]
+        if not page_numbers or not self.ocr:
+            return {}
+        with tracer.span("ocr", paginas_sem_texto=len(page_numbers)) as span:
+            image_hashes = _page_image_hashes(pdf_bytes, page_numbers)
+            span["paginas_imagem"] = len(image_hashes)
+            if not image_hashes:
+                return {}
+            if not ocr_available():
+                report_error(
+                    f"{len(image_hashes)} página(s) digitalizada(s) sem texto; instale o Tesseract e o pytesseract "
+                    "para ativar o OCR"
+                )
+                return {}
+            texts, pending = {}, []
+            for page_num, image_hash in image_hashes.items():
+                cached = self.cache.get("ocr", image_hash)
+                if cached is not None:
+                    texts[page_num] = cached
+                    tracer.count("ocr_pages", outcome="cache")
+                else:
+                    pending.append(page_num)
+            span["cache_hits"] = len(texts)
+            for page_num, page_text, timings in iter_ocr_pages(pdf_bytes, pending):
+                check_cancelled()
+                if page_text is None:
+                    tracer.count("ocr_pages", outcome="erro")
+                    report_error(f"Falha no OCR da página {page_num}: {timings['erro']}")
+                    continue
+                tracer.record("ocr_page", timings["render"] + timings["ocr"], pagina=page_num,
+                              caracteres=len(page_text), **timings)
+                tracer.count("ocr_pages", outcome="ocr")
+                self.cache.set("ocr", image_hashes[page_num], page_text)
+                texts[page_num] = page_text
+            texts = {n: t for n, t in texts.items() if len(t.strip()) > len(page_texts[n].strip())}
+            span["caracteres"] = sum(len(t) for t in texts.values())
+            return texts
+    
+    def call_openrouter_api(self, prompt: str, model: str = DEFAULT_MODEL, parser: StreamingJSONParser = None,
+                            routes: List[Dict] = None) -> str:
+        routes = routes or [{"model": model, "max_tokens": DEFAULT_MAX_TOKENS, "temperature": DEFAULT_TEMPERATURE}]
+        for i, route in enumerate(routes):
+            fallback = routes[i + 1]["model"] if i + 1 < len(routes) else None
+            content, outcome = self._call_model(prompt, route, parser, can_fallback=fallback is not None)
+            if outcome not in ("timeout", "erro") or fallback is None:
+                return content
+            logger.warning("Modelo %s falhou (%s); usando %s", route["model"], outcome, fallback)
+            tracer.count("model_fallbacks", model=route["model"], fallback=fallback)
+        return ""
+    
+    def _call_model(self, prompt: str, route: Dict, parser: StreamingJSONParser, can_fallback: bool) -> tuple:
+        model = route["model"]
+        started = time.perf_counter()
+        usage, outcome = {}, "erro"
+        try:
+            with tracer.span("api_call", model=model, streaming=parser is not None,
+                             max_tokens=route["max_tokens"]) as span:
+                payload = {
+                    "model": model,
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    "max_tokens": route["max_tokens"],
+                    "temperature": route.get("temperature", DEFAULT_TEMPERATURE),
+                    "usage": {"include": True}
+                }
+                if parser is not None:
+                    payload["stream"] = True
+                span["bytes_enviados"] = len(prompt.encode("utf-8"))
+                
+                response = self.client.post(
+                    self.base_url, payload, stream=parser is not None, read_timeout=route.get("read_timeout"),
+                    retry_timeouts=not can_fallback
+                )
+                span["espera_rede"] = round(response.elapsed.total_seconds(), 6)
+                span["status"] = response.status_code
+                span["retries"] = getattr(response, "retry_count", 0)
+                tracer.count("api_retries", span["retries"], model=model)
+                
+                if response.status_code != 200:
+                    tracer.count("api_errors", model=model, status=response.status_code)
+                    if not can_fallback:
+                        report_error(f"Erro na API: {response.status_code} - {response.text}")
+                    return "", outcome
+                if parser is None:
+                    data = response.json()
+                    usage = data.get("usage") or {}
+                    content = data["choices"][0]["message"]["content"]
+                    span["bytes_recebidos"] = len(response.content)
+                else:
+                    chunks = []
+                    try:
+                        for delta in iter_sse_content(response, usage):
+                            check_cancelled()
+                            if not chunks:
+                                span["primeiro_token"] = round(time.perf_counter() - started, 6)
+                            chunks.append(delta)
+                            parser.feed(delta)
+                    except (requests.RequestException, ValueError) as e:
+                        span["interrompido"] = True
+                        report_error(f"Streaming interrompido: {str(e)}")
+                    finally:
+                        response.close()
+                    content = "".join(chunks)
+                    span["bytes_recebidos"] = len(content.encode("utf-8"))
+                outcome = "ok"
+                span["geracao"] = round(time.perf_counter() - started - span["espera_rede"], 6)
+                span["prompt_tokens"] = usage.get("prompt_tokens")
+                span["completion_tokens"] = usage.get("completion_tokens")
+                span["custo"] = usage.get("cost")
+                tracer.count("prompt_tokens", usage.get("prompt_tokens") or 0, model=model)
+                tracer.count("completion_tokens", usage.get("completion_tokens") or 0, model=model)
+                return content, outcome
+                
+        except JobCancelled:
+            outcome = "cancelado"
+            raise
+        except requests.Timeout as e:
+            outcome = "timeout"
+            if not can_fallback:
+                report_error(f"Tempo esgotado na chamada da API ({model}): {str(e)}")
+            return "", outcome
+        except Exception as e:
+            report_error(f"Erro na chamada da API: {str(e)}")
+            return "", outcome
+        finally:
+            if outcome != "cancelado":
+                self.model_router.record(route, time.perf_counter() - started, outcome, usage)
+    
+    def run_agent_prompt(self, agent_name: str, agent_label: str, pdf_text: str, prompt: str,
+                         fallback: Dict, model: str = None) -> Dict:
+        with tracer.span("agent", agent=agent_name, caracteres=len(pdf_text)) as span:
+            routes = self.model_router.routes(agent_name, pdf_text)
+            if model:
+                routes = [dict(routes[0], model=model)]
+            span["model"] = routes[0]["model"]
+            cache_key = content_hash(f"{PROMPT_VERSIONS[agent_name]}|{routes[0]['model']}|{content_hash(pdf_text)}")
+            cached = self.cache.get(f"agent_{agent_name}", cache_key)
+            span["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+            progress = current_progress()
+            parser = StreamingJSONParser(on_item=lambda key, item: progress.on_agent_item(agent_name, key, item))
+            response = self.call_openrouter_api(prompt, parser=parser if self.streaming else None, routes=routes)
+        with tracer.span("parse", agent=agent_name, caracteres=len(response)) as span:
+            parsed, status = recover_json(response)
+            if parsed is None:
+                if not self.streaming:
+                    parser.feed(response)
+                partial = parser.partial_result()
+            span["status"] = status
+        if parsed is None and partial.get(AGENT_ITEM_ARRAYS.get(agent_name)):
+            parsed, status = self.continue_truncated(agent_name, prompt, routes, fallback, partial)
+        self.record_parse(agent_name, status)
+        if parsed is None:
+            report_error(f"Erro ao processar resposta do agente {agent_label}: resposta {status}")
+            return fallback
+        if status == "recuperado":
+            report_error(
+                f"Resposta do agente {agent_label} incompleta; "
+                f"{len(parsed.get(AGENT_ITEM_ARRAYS[agent_name], []))} itens recuperados"
+            )
+            return parsed
+        self.cache.set(f"agent_{agent_name}", cache_key, parsed)
+        return parsed
+
+    def continue_truncated(self, agent_name: str, prompt: str, routes: List[Dict], fallback: Dict,
+                           partial: Dict) -> tuple:
+        array_key = AGENT_ITEM_ARRAYS[agent_name]
+        result = dict(fallback, **partial)
+        progress = current_progress()
+        for _ in range(MAX_CONTINUATIONS):
+            self.record_parse(agent_name, "continuacao")
+            parser = StreamingJSONParser(on_item=lambda key, item: progress.on_agent_item(agent_name, key, item))
+            response = self.call_openrouter_api(
+                continuation_prompt(prompt, agent_name, result), parser=parser if self.streaming else None,
+                routes=routes
+            )
+            parsed, status = recover_json(response)
+            if parsed is None:
+                if not self.streaming:
+                    parser.feed(response)
+                parsed = parser.partial_result()
+            if parsed.get(array_key):
+                merged = merge_agent_results(agent_name, [([], result), ([], {array_key: parsed[array_key]})])
+                result[array_key] = merged[array_key]
+            if status in ("ok", "reparado"):
+                return result, "continuado"
+            if not parsed.get(array_key):
+                break
+        return result, "recuperado"
+
+    def record_parse(self, agent_name: str, status: str):
+        with self.stats_lock:
+            self.parse_stats[status] = self.parse_stats.get(status, 0) + 1
+        tracer.count("parse_results", agent=agent_name, status=status)
+
+    def agent_valores_completo(self, pdf_text: str) -> Dict:
+        prompt = f"""
+Você é um agente especializado em extrair TODOS os VALORES e PLANOS de documentos de planos de saúde.
+
+INSTRUÇÕES CRÍTICAS:
+- Extraia TODAS as tabelas de preços encontradas no PDF.
+- Inclua TODOS os planos, mesmo que tenham nomes semelhantes.
+- Extraia TODAS as segmentações (ex.: 01-29 vidas, 30-99 vidas).
+- Inclua TODOS os produtos e suas faixas etárias (00-18, 19-23, 24-28, ..., 59+).
+- Identifique TODAS as acomodações (Ambulatorial, Enfermaria, Apartamento).
+- NÃO omita nenhuma tabela, linha ou valor, mesmo que pareçam redundantes.
+- Cada linha de tabela deve ser um objeto independente no array `planos_precos`.
+- Indique claramente em qual página ou seção a informação foi encontrada.
+- Utilize exatamente os valores monetários ou percentuais como aparecem no PDF.
+- Extraia também observações, taxas e notas associadas aos preços.
+
+TEXTO COMPLETO DO PDF:
+{pdf_text}
+
+Retorne APENAS um JSON válido seguindo esta estrutura exata:
+{{
+    "empresa": "nome_detectado_ou_empresa_desconhecida",
+    "tipo_documento": "detectado_automaticamente",
+    "regional": "regiao_detectada_ou_nao_especificada",
+    "vigencia": {{"inicio": "data_ou_null", "fim": "data_ou_null"}},
+    "planos_precos": [
+        {{
+            "id": "uuid",
+            "produto": "nome_exato_do_plano",
+            "tabela_origem": "nome_da_tabela",
+            "posicao_na_pagina": "pagina_onde_encontrou",
+            "empresa": "detectada",
+            "tipo": "Ambulatorial_ou_Hospitalar_ou_Amb_Hosp_Obst",
+            "categoria": "PME_ou_MEI_ou_ADESAO_ou_PJ",
+            "segmentacao": "01_29_vidas_ou_30_99_vidas",
+            "registro_ans": "numero_registro_se_encontrado",
+            "acomodacao": "Enfermaria_Apartamento_ou_Nenhum",
+            "descricao": "descricao_completa_do_plano",
+            "valores_faixas": {{
+                "00-18": "R$_valor_exato",
+                "19-23": "R$_valor_exato",
+                "24-28": "R$_valor_exato",
+                "29-33": "R$_valor_exato",
+                "34-38": "R$_valor_exato",
+                "39-43": "R$_valor_exato",
+                "44-48": "R$_valor_exato",
+                "49-53": "R$_valor_exato",
+                "54-58": "R$_valor_exato",
+                "59+": "R$_valor_exato"
+            }},
+            "detalhes_adicionais": "informacoes_relevantes",
+            "observacoes": "notas_importantes"
+        }}
+    ]
+}}
+"""
+        return self.run_agent_prompt("valores", "valores", pdf_text, prompt, {"empresa": "empresa_desconhecida", "planos_precos": []})
+    
+    def agent_cabecalho(self, pdf_text: str) -> Dict:
+        prompt = f"""
+Você é um agente especializado em identificar o CABEÇALHO de documentos de planos de saúde.
+
+INSTRUÇÕES CRÍTICAS:
+- Extraia SOMENTE a operadora, o tipo de documento, a regional e a vigência.
+- As tabelas de preço deste documento JÁ FORAM LIDAS: NÃO extraia planos, tabelas ou valores.
+- NÃO inclua o campo `planos_precos` nem qualquer outro array na resposta.
+
+TEXTO DO PDF:
+{pdf_text}
+
+Retorne APENAS um JSON válido seguindo esta estrutura exata:
+{{
+    "empresa": "nome_detectado_ou_empresa_desconhecida",
+    "tipo_documento": "detectado_automaticamente",
+    "regional": "regiao_detectada_ou_nao_especificada",
+    "vigencia": {{"inicio": "data_ou_null", "fim": "data_ou_null"}}
+}}
+"""
+        result = self.run_agent_prompt("cabecalho", "cabeçalho", pdf_text, prompt, {"empresa": "empresa_desconhecida"})
+        return {key: result[key] for key in HEADER_FIELDS if key in result}
+    
+    def agent_coparticipacao_completo(self, pdf_text: str) -> Dict:
+       
+        import uuid
+        prompt = f"""
+Você é um agente especializado em extrair TODAS as COPARTICIPAÇÕES e TAXAS de documentos de planos de saúde.
+
+INSTRUÇÕES CRÍTICAS:
+- Extraia TODAS as tabelas de coparticipação e taxas encontradas.
+- Inclua valores para:
+  - Consultas (eletiva, telemedicina, urgência/emergência)
+  - Exames (simples, especiais, complexos)
+  - Terapias (simples, especiais)
+  - Procedimentos ambulatoriais
+  - Internações (enfermaria, apartamento)
+  - Taxas administrativas (taxa de adesão, cadastro, etc.)
+- Capture tanto valores fixos quanto percentuais (%)
+- Se houver limites por valor (ex.: “30% limitado a R$ 146,20”), capture percentual e limite
+- Relacione cada tabela de coparticipação aos produtos correspondentes (extraídos pelo agente de valores)
+- Não omita nenhuma linha, mesmo que repetida
+
+TEXTO COMPLETO DO PDF:
+{pdf_text}
+
+Retorne APENAS um JSON válido seguindo esta estrutura:
+{{
+    "tabelas_valores": [
+        {{
+            "id": "{str(uuid.uuid4())}",
+            "tabela_origem": "identificador_da_tabela",
+            "posicao_na_pagina": "pagina_onde_encontrou",
+            "tipo": "coparticipacao_ambulatorial_ou_hospitalar_ou_taxas",
+            "descricao": "descricao_detalhada_da_tabela",
+            "aplica_produtos": ["lista_de_produtos_relacionados"],
+            "valores": {{
+                "consulta_eletiva": "valor_exato",
+                "consulta_telemedicina": "valor_exato",
+                "consulta_urgencia": "valor_exato",
+                "exames_simples": "valor_ou_percentual",
+                "exames_especiais": "valor_ou_percentual",
+                "terapia_simples": "valor_ou_percentual",
+                "terapia_especial": "valor_ou_percentual",
+                "procedimentos_ambulatoriais": "valor_ou_percentual",
+                "internacao_enfermaria": "valor_exato_ou_percentual",
+                "internacao_apartamento": "valor_exato_ou_percentual",
+                "taxa_adesao": "valor_exato_ou_null"
+            }},
+            "observacoes": "detalhes_importantes_extras"
+        }}
+    ]
+}}
+"""
+        return self.run_agent_prompt("coparticipacao", "coparticipação", pdf_text, prompt, {"tabelas_valores": []})
+
+    
+    def agent_rede_credenciada_completo(self, pdf_text: str) -> Dict:
+
+        prompt = f"""
+Você é um agente especializado em extrair TODAS as informações sobre REDE CREDENCIADA de documentos de planos de saúde.
+
+INSTRUÇÕES CRÍTICAS:
+- Extraia TODOS os hospitais, clínicas, laboratórios e outros estabelecimentos citados
+- Inclua todos os endereços, contatos e especialidades sempre que disponíveis
+- Relacione cada estabelecimento aos produtos/plans em que está disponível (extraídos pelo agente de valores)
+- Classifique cada item por tipo: hospital, clínica, laboratório, pronto-atendimento, consultório, etc.
+- Indique se é “rede credenciada” ou “rede própria”
+- Inclua cidade e região mencionadas
+- Se não houver rede listada, retorne um JSON válido vazio, mas mantenha a estrutura
+- Verifique TODAS as páginas, mesmo em notas de rodapé ou anexos
+
+TEXTO COMPLETO DO PDF:
+{pdf_text}
+
+Retorne APENAS um JSON válido seguindo esta estrutura:
+{{
+    "informacoes_gerais": [
+        {{
+            "tipo": "hospitais_ou_clinicas_ou_laboratorios_ou_outros",
+            "categoria": "rede_credenciada_ou_rede_propria",
+            "regiao": "regiao_detectada",
+            "lista": [
+                {{
+                    "nome": "nome_exato_do_estabelecimento",
+                    "cidade": "cidade_detectada",
+                    "posicao_na_pagina": "pagina_onde_encontrou",
+                    "detalhes": "informacoes_adicionais_e_especialidades",
+                    "endereco": "endereco_completo_se_disponivel",
+                    "contato": "telefone_email_ou_null",
+                    "produtos_disponiveis": ["lista_de_produtos"],
+                    "disponibilidade_por_produto": {{
+                        "produto_x": "disponivel_ou_nao_disponivel",
+                        "produto_y": "disponivel_ou_nao_disponivel"
+                    }}
+                }}
+            ]
+        }}
+    ]
+}}
+"""
+        return self.run_agent_prompt("rede", "rede", pdf_text, prompt, {"informacoes_gerais": []})
+
+    def process_pdf_completo(self, pdf_file, page_number: int = 1, progress: "ProgressCallback" = None,
+                             trace_id: str = None, previous: Dict = None) -> Dict:
+        progress = progress or ProgressCallback()
+        previous_progress = getattr(_progress_local, "callback", None)
+        previous_trace = tracer.trace_id
+        _progress_local.callback = progress
+        tracer.bind(trace_id or uuid.uuid4().hex)
+        try:
+            arquivo = getattr(pdf_file, "name", None) or (pdf_file if isinstance(pdf_file, str) else None)
+            with tracer.span("process_pdf", arquivo=arquivo, incremental=previous is not None):
+                result = self._process_pdf(pdf_file, page_number, progress, previous)
+            if result:
+                self.store_result(result, arquivo)
+            return result
+        finally:
+            _progress_local.callback = previous_progress
+            tracer.bind(previous_trace)
+            try:
+                tracer.write_prometheus()
+                self.model_router.save()
+            except OSError as e:
+                logger.warning("Falha ao gravar métricas: %s", e)
+
+    def store_result(self, result: Dict, arquivo: str = None):
+        try:
+            with tracer.span("store", arquivo=arquivo) as span:
+                span["documento_id"] = self.store.ingest(result, arquivo)
+        except sqlite3.Error as e:
+            logger.warning("Falha ao gravar o resultado no banco de consultas: %s", e)
+
+    def _process_pdf(self, pdf_file, page_number: int, progress: "ProgressCallback", previous: Dict = None) -> Dict:
+        
+        if self.table_fast_path:
+            content = self.extract_pdf_content(pdf_file)
+            pdf_text = content["text"]
+            deterministic_planos = content["planos_precos"]
+            valores_text = "".join(
+                f"\n=== PÁGINA {page_num} ===\n{page_text}\n"
+                for page_num, page_text in split_pages(pdf_text)
+                if page_num not in set(content["paginas_resolvidas"])
+            )
+            header_only = not valores_text
+            if header_only:
+                valores_text = "".join(f"\n=== PÁGINA {n} ===\n{t}\n" for n, t in split_pages(pdf_text)[:1])
+        else:
+            pdf_text = self.extract_text_from_pdf(pdf_file)
+            deterministic_planos = []
+            valores_text = pdf_text
+            header_only = False
+        
+        if not pdf_text:
+            return {}
+        
+        hashes = page_hashes(pdf_text)
+        diff, baseline = None, {}
+        if previous and previous.get(PAGE_HASHES_KEY):
+            diff = diff_pages(previous[PAGE_HASHES_KEY], hashes)
+            baseline = previous_partials(previous, diff)
+        elif previous:
+            logger.warning("Versão anterior sem %s; processando o documento inteiro", PAGE_HASHES_KEY)
+        
+        result = {
+            "pagina": page_number,
+            "empresa": "empresa_desconhecida",
+            "tipo_documento": "detectado_automaticamente",
+            "regional": "nao_especificada",
+            "vigencia": {"inicio": None, "fim": None},
+            "tipo_pagina": "precos_ou_informativa",
+            "planos_precos": [],
+            "tabelas_valores": [],
+            "informacoes_gerais": []
+        }
+        
+        agents = [
+            ("valores", self.agent_cabecalho if header_only else self.agent_valores_completo,
+             "Lendo o cabeçalho..." if header_only else "Processando as tabelas...", "Planos Extraídos",
+             lambda r: len(r.get("planos_precos", []))),
+            ("coparticipacao", self.agent_coparticipacao_completo, "Processando todas as taxas...", "Tabelas de Valores",
+             lambda r: len(r.get("tabelas_valores", []))),
+            ("rede", self.agent_rede_credenciada_completo, "Processando toda a rede...", "Estabelecimentos",
+             lambda r: sum(len(info.get("lista", [])) for info in r.get("informacoes_gerais", []))),
+        ]
+        
+        progress.on_start([name for name, *_ in agents])
+        agent_texts = {"valores": valores_text, "coparticipacao": pdf_text, "rede": pdf_text}
+        if diff is not None:
+            reprocess = set(diff["alteradas"])
+            agent_texts = {
+                name: text if baseline[name] is None else select_pages(text, reprocess)
+                for name, text in agent_texts.items()
+            }
+            if baseline["valores"] is not None:
+                deterministic_planos = [
+                    plano for plano in deterministic_planos if cited_pages(plano.get("posicao_na_pagina")) & reprocess
+                ]
+            progress.on_stage(
+                f"Versão anterior reaproveitada: {diff['reaproveitadas']} página(s) iguais, "
+                f"{len(reprocess)} para reprocessar", 5
+            )
+        if self.route_tokens is not None:
+            agent_texts = {
+                name: text if name == "valores" and header_only else self.router.route(text, name, self.route_tokens)
+                for name, text in agent_texts.items()
+            }
+        chunks = {
+            name: build_chunks(text, self.chunk_tokens) if self.chunk_tokens else [([], text)]
+            for name, text in agent_texts.items()
+        }
+        progress.on_stage(
+            f"Executando {len(agents)} agentes em {max(len(c) for c in chunks.values())} bloco(s) "
+            f"(até {self.max_workers} em paralelo)...", 10
+        )
+        for name, _, working_msg, _, _ in agents:
+            progress.on_agent_start(name, working_msg)
+        
+        agent_results = {}
+        partials = {agent[0]: [] for agent in agents}
+        failed = set()
+        
+        trace_id = tracer.trace_id
+        
+        def run_agent(agent_fn, chunk_text):
+            if not chunk_text:
+                return {}
+            tracer.bind(trace_id)
+            _progress_local.callback = progress
+            progress.bind_thread()
+            check_cancelled()
+            return agent_fn(chunk_text)
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {
+                executor.submit(run_agent, agent[1], chunk_text): (agent, pages)
+                for agent in agents for pages, chunk_text in chunks[agent[0]]
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                check_cancelled()
+                agent, pages = futures[future]
+                name, _, _, metric_label, count_fn = agent
+                try:
+                    partials[name].append((pages, future.result()))
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    progress.on_error(f"Erro no agente {name}: {str(e)}")
+                    failed.add(name)
+                    partials[name].append((pages, {}))
+                if len(partials[name]) == len(chunks[name]):
+                    partials[name].sort(key=lambda p: p[0][:1])
+                    if name == "valores" and deterministic_planos:
+                        partials[name].insert(0, ([], {"planos_precos": deterministic_planos}))
+                    agent_results[name] = merge_agent_results(name, partials[name])
+                    if baseline.get(name) is not None:
+                        agent_results[name] = patch_agent_result(name, agent_results[name], baseline[name])
+                    progress.on_agent_done(name, metric_label, count_fn(agent_results[name]), name in failed)
+                progress.on_stage(None, 10 + int(80 * done / len(futures)))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        agent1_result = agent_results["valores"]
+        agent2_result = agent_results["coparticipacao"]
+        agent3_result = agent_results["rede"]
+        
+        progress.on_stage("Combinando resultados...", 100)
+        
+        if agent1_result:
+            result.update({
+                "empresa": agent1_result.get("empresa", "empresa_desconhecida"),
+                "tipo_documento": agent1_result.get("tipo_documento", "detectado_automaticamente"),
+                "regional": agent1_result.get("regional", "nao_especificada"),
+                "vigencia": agent1_result.get("vigencia", {"inicio": None, "fim": None}),
+                "planos_precos": agent1_result.get("planos_precos", [])
+            })
+        
+        if agent2_result:
+            result["tabelas_valores"] = agent2_result.get("tabelas_valores", [])
+        
+        if agent3_result:
+            result["informacoes_gerais"] = agent3_result.get("informacoes_gerais", [])
+        
+        result[PAGE_HASHES_KEY] = hashes
+        if diff is not None:
+            result["alteracoes"] = change_report(
+                previous, result, diff, [name for name, partial in baseline.items() if partial is None]
+            )
+        
+        progress.on_finish()
+        
+        return result
+
+
+JOBS_DIR = "jobs"
+JOBS_DB_PATH = os.path.join(JOBS_DIR, "jobs.sqlite")
+JOB_WORKERS = 2
+JOB_POLL_SECONDS = 1.0
+JOB_ACTIVE_STATUSES = ("fila", "processando")
+
+
+class JobProgress(ProgressCallback):
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.checked = 0.0
+        self.was_cancelled = False
+
+    def on_stage(self, message: str, percent: int):
+        fields = {"progresso": percent}
+        if message:
+            fields["mensagem"] = message
+        self.queue.update(self.job_id, **fields)
+
+    def on_agent_done(self, agent_name: str, metric_label: str, count: int, failed: bool):
+        self.queue.update(
+            self.job_id, mensagem=f"{agent_name} {'falhou' if failed else 'concluído'} ({metric_label}: {count})"
+        )
+
+    def on_error(self, message: str):
+        logger.error("job %s: %s", self.job_id, message)
+
+    def cancelled(self) -> bool:
+        if not self.was_cancelled and time.monotonic() - self.checked >= JOB_POLL_SECONDS:
+            self.checked = time.monotonic()
+            self.was_cancelled = self.queue.is_cancelled(self.job_id)
+        return self.was_cancelled
+
+
+class JobQueue:
+    def __init__(self, db_path: str = JOBS_DB_PATH, workers: int = JOB_WORKERS, api_key: str = OPENROUTER_API_KEY):
+        self.db_path = db_path
+        self.workers = workers
+        self.api_key = api_key
+        self.uploads_dir = os.path.join(os.path.dirname(db_path) or ".", "uploads")
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.extractors = {}
+        self.threads = []
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, cliente TEXT NOT NULL, arquivo TEXT NOT NULL, pdf_path TEXT NOT NULL, "
+                "opcoes TEXT NOT NULL, status TEXT NOT NULL, progresso INTEGER NOT NULL DEFAULT 0, "
+                "mensagem TEXT, erro TEXT, resultado TEXT, cancelar INTEGER NOT NULL DEFAULT 0, "
+                "criado REAL NOT NULL, iniciado REAL, finalizado REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_cliente ON jobs (cliente, criado)")
+            conn.execute("UPDATE jobs SET status = 'fila', progresso = 0 WHERE status = 'processando'")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}")
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, cliente: str, arquivo: str, pdf_bytes: bytes, opcoes: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        pdf_path = os.path.join(self.uploads_dir, f"{content_hash(pdf_bytes)}.pdf")
+        if not os.path.exists(pdf_path):
+            with open(pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, cliente, arquivo, pdf_path, opcoes, status, mensagem, criado) "
+                "VALUES (?, ?, ?, ?, ?, 'fila', 'Aguardando na fila...', ?)",
+                (job_id, cliente, arquivo, pdf_path, json.dumps(opcoes, sort_keys=True), time.time())
+            )
+        self.wake.set()
+        return job_id
+
+    def get(self, job_id: str) -> Dict:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT id, cliente, arquivo, status, progresso, mensagem, erro, criado, iniciado, finalizado "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, cliente: str, limit: int = 50) -> List[Dict]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT id, cliente, arquivo, status, progresso, mensagem, erro, criado, iniciado, finalizado "
+                "FROM jobs WHERE cliente = ? ORDER BY criado DESC LIMIT ?", (cliente, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def result(self, job_id: str) -> Dict:
+        with self._connect() as conn:
+            row = conn.execute("SELECT resultado FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def cancel(self, job_id: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancelar = 1 WHERE id = ? AND status IN ('fila', 'processando')", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelado', mensagem = 'Cancelado', finalizado = ? "
+                "WHERE id = ? AND status = 'fila'", (time.time(), job_id)
+            )
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancelar FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _claim(self) -> Dict:
+        with self.lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT j.* FROM jobs j WHERE j.status = 'fila' AND j.cancelar = 0 ORDER BY "
+                "(SELECT COUNT(*) FROM jobs r WHERE r.cliente = j.cliente AND r.status = 'processando'), "
+                "j.criado LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'processando', iniciado = ?, mensagem = 'Iniciando...' WHERE id = ?",
+                (time.time(), row["id"])
+            )
+            return dict(row)
+
+    def _extractor(self, opcoes: Dict) -> PDFExtractorAgents:
+        key = json.dumps(opcoes, sort_keys=True)
+        with self.lock:
+            if key not in self.extractors:
+                self.extractors[key] = PDFExtractorAgents(self.api_key, **opcoes)
+            return self.extractors[key]
+
+    def _worker(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self.wake.wait(JOB_POLL_SECONDS)
+                self.wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict):
+        opcoes = json.loads(job["opcoes"])
+        page_number = opcoes.pop("page_number", 1)
+        progress = JobProgress(self, job["id"])
+        try:
+            result = self._extractor(opcoes).process_pdf_completo(
+                job["pdf_path"], page_number, progress=progress, trace_id=job["id"]
+            )
+        except JobCancelled:
+            self.update(job["id"], status="cancelado", mensagem="Cancelado", finalizado=time.time())
+            return
+        except Exception as e:
+            logger.exception("job %s falhou", job["id"])
+            self.update(job["id"], status="falhou", erro=str(e), mensagem="Falhou", finalizado=time.time())
+            return
+        if progress.cancelled():
+            self.update(job["id"], status="cancelado", mensagem="Cancelado", finalizado=time.time())
+        elif result:
+            self.update(
+                job["id"], status="concluido", progresso=100, mensagem="Concluído",
+                resultado=json.dumps(result, ensure_ascii=False), finalizado=time.time()
+            )
+        else:
+            self.update(job["id"], status="falhou", erro="Nenhum texto extraído do PDF", mensagem="Falhou",
+                        finalizado=time.time())
+
+
+STORE_DIR = "store"
+STORE_DB_PATH = os.path.join(STORE_DIR, "resultados.sqlite")
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY, chave TEXT NOT NULL UNIQUE, arquivo TEXT, empresa TEXT COLLATE NOCASE,
+    tipo_documento TEXT, regional TEXT COLLATE NOCASE, vigencia_inicio TEXT, vigencia_fim TEXT, ingerido REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS planos (
+    id INTEGER PRIMARY KEY, documento_id INTEGER NOT NULL REFERENCES documentos (id) ON DELETE CASCADE,
+    plano_id TEXT, produto TEXT COLLATE NOCASE, empresa TEXT COLLATE NOCASE, tipo TEXT COLLATE NOCASE,
+    categoria TEXT COLLATE NOCASE, segmentacao TEXT, vidas_min INTEGER, vidas_max INTEGER,
+    acomodacao TEXT COLLATE NOCASE, registro_ans TEXT, tabela_origem TEXT, posicao_na_pagina TEXT, descricao TEXT
+);
+CREATE TABLE IF NOT EXISTS precos (
+    plano_id INTEGER NOT NULL REFERENCES planos (id) ON DELETE CASCADE,
+    faixa TEXT NOT NULL, valor REAL, valor_texto TEXT, unidade TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coparticipacao (
+    id INTEGER PRIMARY KEY, documento_id INTEGER NOT NULL REFERENCES documentos (id) ON DELETE CASCADE,
+    tabela_origem TEXT, tipo TEXT, descricao TEXT, item TEXT COLLATE NOCASE, valor REAL, valor_texto TEXT,
+    unidade TEXT
+);
+CREATE TABLE IF NOT EXISTS rede (
+    id INTEGER PRIMARY KEY, documento_id INTEGER NOT NULL REFERENCES documentos (id) ON DELETE CASCADE,
+    tipo TEXT, categoria TEXT, regiao TEXT, nome TEXT COLLATE NOCASE, cidade TEXT COLLATE NOCASE,
+    endereco TEXT, contato TEXT, detalhes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documentos_empresa ON documentos (empresa);
+CREATE INDEX IF NOT EXISTS idx_planos_documento ON planos (documento_id);
+CREATE INDEX IF NOT EXISTS idx_planos_empresa ON planos (empresa);
+CREATE INDEX IF NOT EXISTS idx_planos_produto ON planos (produto);
+CREATE INDEX IF NOT EXISTS idx_planos_filtro ON planos (acomodacao, vidas_min, vidas_max);
+CREATE INDEX IF NOT EXISTS idx_precos_faixa ON precos (faixa, unidade, valor);
+CREATE INDEX IF NOT EXISTS idx_precos_plano ON precos (plano_id);
+CREATE INDEX IF NOT EXISTS idx_coparticipacao_documento ON coparticipacao (documento_id, item);
+CREATE INDEX IF NOT EXISTS idx_rede_cidade ON rede (cidade, documento_id);
+CREATE INDEX IF NOT EXISTS idx_rede_documento ON rede (documento_id);
+"""
+VIDAS_RE = re.compile(r"(\d+)\D+(\d+)")
+
+
+def _parse_amount(text) -> tuple:
+    text = str(text)
+    match = re.search(BRL_AMOUNT_PATTERN, text)
+    if not match:
+        return None, text, ""
+    return float(match.group(1).replace(".", "").replace(",", ".")), text, "%" if "%" in text else "R$"
+
+
+def _parse_vidas(segmentacao) -> tuple:
+    match = VIDAS_RE.search(str(segmentacao or ""))
+    return (int(match.group(1)), int(match.group(2))) if match else (None, None)
+
+
+class ResultStore:
+    def __init__(self, db_path: str = STORE_DB_PATH):
+        self.db_path = db_path
+        if not db_path:
+            return
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(STORE_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def ingest(self, result: Dict, arquivo: str = None) -> int:
+        if not self.db_path or not result:
+            return None
+        chave = content_hash(json.dumps(result.get(PAGE_HASHES_KEY) or result, sort_keys=True, ensure_ascii=False))
+        vigencia = result.get("vigencia") if isinstance(result.get("vigencia"), dict) else {}
+        empresa = result.get("empresa") or ""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documentos WHERE chave = ?", (chave,))
+            documento_id = conn.execute(
+                "INSERT INTO documentos (chave, arquivo, empresa, tipo_documento, regional, vigencia_inicio, "
+                "vigencia_fim, ingerido) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chave, arquivo, empresa, result.get("tipo_documento"), result.get("regional"),
+                 vigencia.get("inicio"), vigencia.get("fim"), time.time())
+            ).lastrowid
+            for plano in result_items(result, "planos_precos"):
+                vidas_min, vidas_max = _parse_vidas(plano.get("segmentacao"))
+                plano_id = conn.execute(
+                    "INSERT INTO planos (documento_id, plano_id, produto, empresa, tipo, categoria, segmentacao, "
+                    "vidas_min, vidas_max, acomodacao, registro_ans, tabela_origem, posicao_na_pagina, descricao) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (documento_id, plano.get("id"), plano.get("produto"), plano.get("empresa") or empresa,
+                     plano.get("tipo"), plano.get("categoria"), plano.get("segmentacao"), vidas_min, vidas_max,
+                     plano.get("acomodacao"), plano.get("registro_ans"), plano.get("tabela_origem"),
+                     plano.get("posicao_na_pagina"), plano.get("descricao"))
+                ).lastrowid
+                faixas = plano.get("valores_faixas") if isinstance(plano.get("valores_faixas"), dict) else {}
+                conn.executemany(
+                    "INSERT INTO precos (plano_id, faixa, valor, valor_texto, unidade) VALUES (?, ?, ?, ?, ?)",
+                    [(plano_id, normalize_faixa(faixa) or faixa, *_parse_amount(texto))
+                     for faixa, texto in faixas.items() if texto]
+                )
+            conn.executemany(
+                "INSERT INTO coparticipacao (documento_id, tabela_origem, tipo, descricao, item, valor, valor_texto, "
+                "unidade) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(documento_id, tabela.get("tabela_origem"), tabela.get("tipo"), tabela.get("descricao"), item,
+                  *_parse_amount(texto))
+                 for tabela in result_items(result, "tabelas_valores")
+                 for item, texto in (tabela.get("valores") if isinstance(tabela.get("valores"), dict) else {}).items()
+                 if texto]
+            )
+            conn.executemany(
+                "INSERT INTO rede (documento_id, tipo, categoria, regiao, nome, cidade, endereco, contato, detalhes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(documento_id, info.get("tipo"), info.get("categoria"), info.get("regiao"), item.get("nome"),
+                  item.get("cidade"), item.get("endereco"), item.get("contato"), item.get("detalhes"))
+                 for info in result.get("informacoes_gerais") or [] if isinstance(info, dict)
+                 for item in info.get("lista", []) if isinstance(item, dict)]
+            )
+        return documento_id
+
+    def _query(self, sql: str, params: List) -> List[Dict]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def search_prices(self, faixa: str = None, acomodacao: str = None, vidas: tuple = None, empresa: str = None,
+                      produto: str = None, cidade: str = None, limit: int = 50) -> List[Dict]:
+        clauses, params = ["pr.unidade = 'R$'", "pr.valor IS NOT NULL"], []
+        if faixa:
+            clauses.append("pr.faixa = ?")
+            params.append(normalize_faixa(faixa) or faixa)
+        if acomodacao:
+            clauses.append("p.acomodacao = ?")
+            params.append(acomodacao)
+        if vidas:
+            clauses.append("p.vidas_min <= ? AND p.vidas_max >= ?")
+            params.extend(vidas)
+        if empresa:
+            clauses.append("p.empresa = ?")
+            params.append(empresa)
+        if produto:
+            clauses.append("p.produto LIKE ?")
+            params.append(f"%{produto}%")
+        if cidade:
+            clauses.append("EXISTS (SELECT 1 FROM rede r WHERE r.cidade = ? AND r.documento_id = p.documento_id)")
+            params.append(cidade)
+        return self._query(
+            "SELECT pr.valor, pr.valor_texto, pr.faixa, p.produto, p.empresa, p.acomodacao, p.segmentacao, p.tipo, "
+            "p.categoria, p.registro_ans, d.vigencia_inicio, d.vigencia_fim, d.arquivo "
+            "FROM precos pr JOIN planos p ON p.id = pr.plano_id JOIN documentos d ON d.id = p.documento_id "
+            f"WHERE {' AND '.join(clauses)} ORDER BY pr.valor LIMIT ?",
+            params + [limit]
+        )
+
+    def search_network(self, cidade: str = None, nome: str = None, empresa: str = None, limit: int = 100) -> List[Dict]:
+        clauses, params = ["1 = 1"], []
+        if cidade:
+            clauses.append("r.cidade = ?")
+            params.append(cidade)
+        if nome:
+            clauses.append("r.nome LIKE ?")
+            params.append(f"%{nome}%")
+        if empresa:
+            clauses.append("d.empresa = ?")
+            params.append(empresa)
+        return self._query(
+            "SELECT r.nome, r.cidade, r.tipo, r.categoria, r.endereco, r.contato, d.empresa, d.arquivo "
+            f"FROM rede r JOIN documentos d ON d.id = r.documento_id WHERE {' AND '.join(clauses)} "
+            "ORDER BY r.cidade, r.nome LIMIT ?",
+            params + [limit]
+        )
+
+    def search_coparticipacao(self, item: str = None, empresa: str = None, limit: int = 100) -> List[Dict]:
+        clauses, params = ["1 = 1"], []
+        if item:
+            clauses.append("c.item LIKE ?")
+            params.append(f"%{item}%")
+        if empresa:
+            clauses.append("d.empresa = ?")
+            params.append(empresa)
+        return self._query(
+            "SELECT c.item, c.valor_texto, c.valor, c.unidade, c.tipo, c.tabela_origem, d.empresa, d.arquivo "
+            f"FROM coparticipacao c JOIN documentos d ON d.id = c.documento_id WHERE {' AND '.join(clauses)} "
+            "ORDER BY c.item, c.valor LIMIT ?",
+            params + [limit]
+        )
+
+    def distinct(self, table: str, column: str) -> List[str]:
+        return [row[column] for row in self._query(
+            f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL AND {column} != '' ORDER BY {column}", []
+        )]
+
+    def summary(self) -> Dict:
+        return self._query(
+            "SELECT (SELECT COUNT(*) FROM documentos) AS documentos, (SELECT COUNT(*) FROM planos) AS planos, "
+            "(SELECT COUNT(*) FROM precos) AS precos, (SELECT COUNT(*) FROM rede) AS rede", []
+        )[0]
+
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    global _result_store
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = ResultStore()
+        return _result_store
+
+
+def _load_checkpoint(path: str) -> Dict[str, Dict]:
+    done = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    done[entry["arquivo"]] = entry
+    return done
+
+
+def _collect_batch_inputs(source: str) -> List[str]:
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith(".pdf")
+        )
+    with open(source, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def batch_main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="run.py batch", description="Converte PDFs de planos de saúde em JSON sem a interface Streamlit.")
+    parser.add_argument("source", help="diretório com PDFs ou manifesto com um caminho por linha")
+    parser.add_argument("-o", "--output", required=True, help="diretório (formato json) ou arquivo .jsonl de saída")
+    parser.add_argument("--format", choices=["json", "jsonl"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=2, help="PDFs processados simultaneamente")
+    parser.add_argument("--max-requests", type=int, default=MAX_CONCURRENT_AGENTS, help="requisições paralelas por PDF")
+    parser.add_argument("--chunk-tokens", type=int, default=0, help="ativa o modo em blocos com este orçamento de tokens")
+    parser.add_argument("--checkpoint", help="arquivo JSONL de progresso usado para retomar execuções interrompidas")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", OPENROUTER_API_KEY))
+    parser.add_argument("--base-url", default=OPENROUTER_BASE_URL)
+    parser.add_argument("--llm-only", action="store_true", help="desativa a leitura determinística das tabelas de preço")
+    parser.add_argument("--route-tokens", type=int, default=ROUTING_TOKEN_BUDGET, help="orçamento de tokens por agente no roteamento de páginas (0 = sem limite)")
+    parser.add_argument("--no-routing", action="store_true", help="envia o documento inteiro a todos os agentes")
+    parser.add_argument("--no-stream", action="store_true", help="aguarda a resposta completa em vez de usar streaming")
+    parser.add_argument("--no-ocr", action="store_true", help="não aplica OCR em páginas digitalizadas sem texto")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="expõe métricas Prometheus nesta porta (0 = desativado)")
+    parser.add_argument("--models", default=MODEL_ROUTING_PATH, help="arquivo JSON com a política de modelos por agente")
+    parser.add_argument("--previous", help="saída JSONL de uma execução anterior; reprocessa só as páginas alteradas de cada PDF")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    setup_logging()
+    if args.metrics_port:
+        tracer.serve_prometheus(args.metrics_port)
+    files = _collect_batch_inputs(args.source)
+    checkpoint = args.checkpoint or (args.output.rstrip("/\\") + ".checkpoint.jsonl")
+    done = _load_checkpoint(checkpoint)
+    pending = [path for path in files if path not in done]
+    logger.info("%d PDFs encontrados, %d já concluídos, %d pendentes", len(files), len(done), len(pending))
+    
+    if args.format == "json":
+        os.makedirs(args.output, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    
+    extractor = PDFExtractorAgents(
+        args.api_key, max_workers=args.max_requests, chunk_tokens=args.chunk_tokens, base_url=args.base_url,
+        table_fast_path=not args.llm_only, route_tokens=None if args.no_routing else args.route_tokens,
+        streaming=not args.no_stream, model_router=ModelRouter(args.models), ocr=not args.no_ocr
+    )
+    write_lock = threading.Lock()
+    failures = 0
+    previous = {}
+    if args.previous:
+        with open(args.previous, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    previous[os.path.basename(entry["arquivo"])] = entry["resultado"]
+        logger.info("%d resultados anteriores carregados de %s", len(previous), args.previous)
+    
+    def convert(path: str) -> Dict:
+        started = time.perf_counter()
+        result = extractor.process_pdf_completo(
+            path, progress=LoggingProgress(path), previous=previous.get(os.path.basename(path))
+        )
+        elapsed = time.perf_counter() - started
+        entry = {"arquivo": path, "ok": bool(result), "segundos": round(elapsed, 3)}
+        if result and result.get("alteracoes"):
+            entry["paginas_reprocessadas"] = len(result["alteracoes"]["paginas_reprocessadas"])
+        with write_lock:
+            if result and args.format == "json":
+                name = os.path.splitext(os.path.basename(path))[0] + f"_{content_hash(path)[:8]}.json"
+                with open(os.path.join(args.output, name), "w", encoding="utf-8") as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+            elif result:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"arquivo": path, "segundos": entry["segundos"], "resultado": result}, ensure_ascii=False) + "\n")
+            if result:
+                with open(checkpoint, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(convert, path): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                entry = future.result()
+            except Exception as e:
+                entry = {"arquivo": futures[future], "ok": False, "erro": str(e)}
+            if not entry["ok"]:
+                failures += 1
+            logger.info("%s %s %ss", "OK" if entry["ok"] else "FALHA", entry["arquivo"], entry.get("segundos", "-"))
+    
+    logger.info("%d PDFs processados em %.1fs, %d falhas", len(pending), time.perf_counter() - started, failures)
+    logger.info("Respostas dos agentes: %s", json.dumps(extractor.parse_stats, sort_keys=True))
+    for model, stats in extractor.model_router.snapshot()["modelos"].items():
+        logger.info("Modelo %s: %d chamadas, %d falhas, latência %.1fs, custo US$ %.4f",
+                    model, stats["chamadas"], stats["falhas"], stats["latencia"], stats["custo_total"])
+    return 1 if failures else 0
+
+PRICE_META_COLUMNS = ["produto", "tipo", "segmentacao", "acomodacao", "tabela_origem"]
+PLANO_EXPORT_COLUMNS = [
+    "id", "produto", "tabela_origem", "posicao_na_pagina", "empresa", "tipo", "categoria", "segmentacao",
+    "registro_ans", "acomodacao", "descricao", "detalhes_adicionais", "observacoes",
+]
+DOCUMENT_FIELDS = ("pagina", *HEADER_FIELDS, "tipo_pagina")
+PARQUET_BATCH_ROWS = 5000
+BRL_AMOUNT_PATTERN = r"(\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:,\d+)?)"
+
+
+def parse_brl_series(values: pd.Series) -> pd.Series:
+    text = values.astype("string")
+    amounts = text.str.extract(BRL_AMOUNT_PATTERN, expand=False)
+    return pd.to_numeric(
+        amounts.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+        errors="coerce"
+    ).astype("float64")
+
+
+def normalize_price_frame(planos: List[Dict]) -> pd.DataFrame:
+    columns = PRICE_META_COLUMNS + ["faixa_etaria", "valor_texto", "valor", "unidade"]
+    df_planos = pd.DataFrame(planos)
+    if df_planos.empty or "valores_faixas" not in df_planos.columns:
+        return pd.DataFrame(columns=columns).astype({"valor": "float64"})
+    meta = df_planos.reindex(columns=PRICE_META_COLUMNS).fillna("N/A")
+    faixas = pd.DataFrame(
+        df_planos["valores_faixas"].where(df_planos["valores_faixas"].map(type) == dict, None)
+        .map(lambda v: v or {}).tolist(),
+        index=df_planos.index
+    )
+    if faixas.empty:
+        return pd.DataFrame(columns=columns).astype({"valor": "float64"})
+    long = (
+        meta.join(faixas)
+        .melt(id_vars=PRICE_META_COLUMNS, var_name="faixa_etaria", value_name="valor_texto")
+        .dropna(subset=["valor_texto"])
+    )
+    long["valor_texto"] = long["valor_texto"].astype("string")
+    long["valor"] = parse_brl_series(long["valor_texto"])
+    long["unidade"] = np.where(long["valor_texto"].str.contains("%", regex=False), "%", "R$")
+    long = long.dropna(subset=["valor"])
+    order = {faixa: i for i, faixa in enumerate(FAIXAS_ETARIAS)}
+    long["_ordem"] = long["faixa_etaria"].map(order).fillna(len(order))
+    return long.sort_values(["_ordem"], kind="stable").drop(columns="_ordem").reset_index(drop=True)[columns]
+
+
+def price_statistics(df_valores: pd.DataFrame) -> Dict:
+    valores = df_valores["valor"].to_numpy(dtype="float64")
+    present = set(df_valores["faixa_etaria"].unique())
+    faixa_order = [f for f in FAIXAS_ETARIAS if f in present] + sorted(present - set(FAIXAS_ETARIAS))
+    por_faixa = (
+        df_valores.groupby("faixa_etaria")["valor"]
+        .agg(["count", "mean", "median", "min", "max"])
+        .reindex(faixa_order)
+    )
+    por_produto = df_valores.pivot_table(
+        index="produto", columns="faixa_etaria", values="valor", aggfunc="mean"
+    ).reindex(columns=faixa_order)
+    return {
+        "media": float(np.mean(valores)),
+        "mediana": float(np.median(valores)),
+        "minimo": float(np.min(valores)),
+        "maximo": float(np.max(valores)),
+        "desvio_padrao": float(np.std(valores)),
+        "total": int(len(valores)),
+        "por_faixa": por_faixa,
+        "por_produto": por_produto,
+    }
+
+
+def bench_prices_main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="run.py bench-prices", description="Microbenchmark da normalização de preços.")
+    parser.add_argument("--planos", type=int, default=5000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args(argv)
+    
+    rng = np.random.default_rng(0)
+    planos = [
+        {
+            "produto": f"Plano {i % 50}",
+            "tipo": "Hospitalar",
+            "segmentacao": "02_29_vidas",
+            "acomodacao": "Enfermaria" if i % 2 else "Apartamento",
+            "tabela_origem": f"tabela_{i % 7}",
+            "valores_faixas": {
+                faixa: f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+                for faixa, v in zip(FAIXAS_ETARIAS, rng.uniform(100, 3000, len(FAIXAS_ETARIAS)))
+            },
+        }
+        for i in range(args.planos)
+    ]
+    timings = []
+    for _ in range(args.repeticoes):
+        started = time.perf_counter()
+        df_valores = normalize_price_frame(planos)
+        price_statistics(df_valores)
+        timings.append(time.perf_counter() - started)
+    print(json.dumps({
+        "planos": args.planos,
+        "celulas": int(len(df_valores)),
+        "segundos_min": round(min(timings), 4),
+        "segundos_mediana": round(float(np.median(timings)), 4),
+        "celulas_por_segundo": int(len(df_valores) / min(timings)),
+    }, indent=2))
+    return 0
+
+
+def iter_rede_rows(result: Dict):
+    for info in result.get("informacoes_gerais", []):
+        for item in info.get("lista", []):
+            item_copy = item.copy()
+            item_copy["tipo"] = info.get("tipo", "")
+            item_copy["categoria"] = info.get("categoria", "")
+            yield item_copy
+
+
+def rede_rows(result: Dict) -> List[Dict]:
+    return list(iter_rede_rows(result))
+
+
+def write_ndjson(result: Dict, sink):
+    sink.write(json.dumps(
+        {"secao": "documento", **{key: result.get(key) for key in DOCUMENT_FIELDS}}, ensure_ascii=False
+    ) + "\n")
+    for secao, records in (("planos_precos", result.get("planos_precos", [])),
+                           ("tabelas_valores", result.get("tabelas_valores", [])),
+                           ("rede", iter_rede_rows(result))):
+        for record in records:
+            sink.write(json.dumps({"secao": secao, **record}, ensure_ascii=False) + "\n")
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def write_planos_parquet(planos: List[Dict], sink, batch_rows: int = PARQUET_BATCH_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema(
+        [(column, pa.string()) for column in PLANO_EXPORT_COLUMNS]
+        + [(faixa, pa.string()) for faixa in FAIXAS_ETARIAS]
+        + [(f"valor_{faixa}", pa.float64()) for faixa in FAIXAS_ETARIAS]
+    )
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for start in range(0, len(planos), batch_rows):
+            batch = [p for p in planos[start:start + batch_rows] if isinstance(p, dict)]
+            frame = pd.DataFrame(batch).reindex(columns=PLANO_EXPORT_COLUMNS).astype("string")
+            faixas = pd.DataFrame(
+                [p["valores_faixas"] if isinstance(p.get("valores_faixas"), dict) else {} for p in batch],
+                index=frame.index
+            ).reindex(columns=FAIXAS_ETARIAS).astype("string")
+            for faixa in FAIXAS_ETARIAS:
+                frame[faixa] = faixas[faixa]
+            for faixa in FAIXAS_ETARIAS:
+                frame[f"valor_{faixa}"] = parse_brl_series(faixas[faixa]).where(
+                    ~faixas[faixa].str.contains("%", regex=False).fillna(False)
+                )
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+
+def export_json(result: Dict) -> bytes:
+    return json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def export_ndjson(result: Dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    sink = io.TextIOWrapper(buffer, encoding="utf-8")
+    write_ndjson(result, sink)
+    sink.flush()
+    sink.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def export_planos_parquet(result: Dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    write_planos_parquet(result.get("planos_precos", []), buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def export_planos_csv(result: Dict) -> bytes:
+    return pd.DataFrame(result.get("planos_precos", [])).to_csv(index=False).encode("utf-8")
+
+
+def export_rede_csv(result: Dict) -> bytes:
+    return pd.DataFrame(rede_rows(result)).to_csv(index=False).encode("utf-8")
+
+
+def _plano_signature(plano: Dict) -> str:
+    valores = plano.get("valores_faixas") if isinstance(plano.get("valores_faixas"), dict) else {}
+    return json.dumps({normalize_faixa(k) or k: re.sub(r"[^\d,]", "", str(v)) for k, v in valores.items()}, sort_keys=True)
+
+
+def compare_tables_main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="run.py compare-tables", description="Compara a leitura determinística das tabelas de preço com o agente de valores (somente LLM).")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", OPENROUTER_API_KEY))
+    parser.add_argument("--base-url", default=OPENROUTER_BASE_URL)
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    extractor = PDFExtractorAgents(args.api_key, cache=ResultCache(db_path=None), base_url=args.base_url)
+    report = []
+    for path in args.pdfs:
+        started = time.perf_counter()
+        content = extractor.extract_pdf_content(path)
+        deterministic_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        llm_planos = extractor.agent_valores_completo(content["text"]).get("planos_precos", [])
+        llm_seconds = time.perf_counter() - started
+        llm_signatures = {_plano_signature(p) for p in llm_planos}
+        matched = sum(1 for p in content["planos_precos"] if _plano_signature(p) in llm_signatures)
+        resolved = set(content["paginas_resolvidas"])
+        remaining = sum(len(t) for n, t in split_pages(content["text"]) if n not in resolved)
+        report.append({
+            "arquivo": path,
+            "planos_deterministicos": len(content["planos_precos"]),
+            "planos_llm": len(llm_planos),
+            "concordancia": round(matched / len(content["planos_precos"]), 4) if content["planos_precos"] else None,
+            "paginas_resolvidas": sorted(resolved),
+            "segundos_deterministico": round(deterministic_seconds, 3),
+            "segundos_llm": round(llm_seconds, 3),
+            "reducao_texto_prompt": round(1 - remaining / len(content["text"]), 4) if content["text"] else 0.0,
+        })
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def store_main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="run.py store", description="Banco local de consultas sobre os resultados extraídos.")
+    parser.add_argument("--db", default=STORE_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="importa resultados JSON ou saídas JSONL do modo batch")
+    ingest.add_argument("arquivos", nargs="+")
+    query = commands.add_parser("query", help="lista os menores preços por faixa etária")
+    query.add_argument("--faixa", default="59+")
+    query.add_argument("--acomodacao")
+    query.add_argument("--vidas", help="faixa de vidas coberta pelo plano, ex.: 30-99")
+    query.add_argument("--empresa")
+    query.add_argument("--produto")
+    query.add_argument("--cidade", help="somente documentos com rede credenciada nesta cidade")
+    query.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    store = ResultStore(args.db)
+    if args.command == "ingest":
+        count = 0
+        for path in args.arquivos:
+            with open(path, encoding="utf-8") as f:
+                if path.endswith(".jsonl"):
+                    entries = [json.loads(line) for line in f if line.strip()]
+                else:
+                    entries = [{"arquivo": path, "resultado": json.load(f)}]
+            for entry in entries:
+                store.ingest(entry["resultado"], entry.get("arquivo"))
+                count += 1
+        logger.info("%d resultados importados; banco: %s", count, json.dumps(store.summary()))
+        return 0
+    started = time.perf_counter()
+    rows = store.search_prices(
+        faixa=args.faixa, acomodacao=args.acomodacao, vidas=_parse_vidas(args.vidas) if args.vidas else None,
+        empresa=args.empresa, produto=args.produto, cidade=args.cidade, limit=args.limit
+    )
+    elapsed = time.perf_counter() - started
+    print(pd.DataFrame(rows).to_string(index=False) if rows else "Nenhum plano encontrado.")
+    logger.info("%d linhas em %.1f ms", len(rows), elapsed * 1000)
+    return 0
@@ -1,15 +1,25 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import json
 import uuid
-import requests
 from datetime import datetime
-import pdfplumber
-import io
-import re
-from typing import Dict, List, Any
+from typing import Dict, List
 import time
+import sys
+import itertools
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import pipeline
+from pipeline import (
+    OPENROUTER_API_KEY, MAX_CONCURRENT_AGENTS, MAX_PARALLEL_REQUESTS, CHUNK_TOKEN_BUDGET, ROUTING_TOKEN_BUDGET,
+    HTTP_POOL_SIZE, METRICS_PORT, FAIXAS_ETARIAS, JOB_ACTIVE_STATUSES, DOCUMENT_FIELDS,
+    content_hash, setup_logging, ocr_available, parquet_available, iter_rede_rows,
+    OpenRouterClient, ProgressCallback, PDFExtractorAgents, JobQueue, ResultStore, _parse_vidas,
+    normalize_price_frame, price_statistics,
+    export_json, export_ndjson, export_planos_parquet, export_planos_csv, export_rede_csv,
+    batch_main, bench_prices_main, compare_tables_main, store_main,
+)
 
 st.set_page_config(
     page_title="PDF to JSON",
@@ -18,488 +28,536 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-OPENROUTER_API_KEY = ""
 
-class PDFExtractorAgents:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+class StreamlitProgress(ProgressCallback):
+    AGENT_TITLES = {
+        "valores": "Valores Completo",
+        "coparticipacao": "Coparticipação Completo",
+        "rede": "Rede Credenciada Completo",
+    }
+
+    STREAM_COUNT_LABELS = {
+        "planos_precos": "Planos Extraídos",
+        "tabelas_valores": "Tabelas de Valores",
+        "lista": "Estabelecimentos",
+    }
+
+    def __init__(self):
+        self.ctx = get_script_run_ctx()
+        self.widgets = {}
+        self.item_counts = {}
+        self.lock = threading.Lock()
+
+    def bind_thread(self):
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+
+    def on_start(self, agent_names: List[str]):
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        for name, col in zip(agent_names, st.columns(len(agent_names))):
+            with col:
+                st.markdown(self.AGENT_TITLES.get(name, name))
+                self.widgets[name] = (st.empty(), st.empty())
+                self.widgets[name][0].info("Aguardando...")
+
+    def on_stage(self, message: str, percent: int):
+        if message:
+            self.status_text.text(message)
+        self.progress_bar.progress(percent)
+
+    def on_agent_start(self, agent_name: str, message: str):
+        self.widgets[agent_name][0].warning(message)
+
+    def on_agent_item(self, agent_name: str, item_key: str, item: Dict):
+        label = self.STREAM_COUNT_LABELS.get(item_key)
+        if not label:
+            return
+        with self.lock:
+            self.item_counts[agent_name] = self.item_counts.get(agent_name, 0) + 1
+            self.widgets[agent_name][1].metric(label, self.item_counts[agent_name])
+
+    def on_agent_done(self, agent_name: str, metric_label: str, count: int, failed: bool):
+        agent_status, agent_count = self.widgets[agent_name]
+        agent_count.metric(metric_label, count)
+        if failed:
+            agent_status.error("Falhou")
+        else:
+            agent_status.success("Concluído")
+
+    def on_error(self, message: str):
+        st.error(message)
+
+    def on_finish(self):
+        self.progress_bar.empty()
+        self.status_text.empty()
+
+
+PREVIEW_PAGE_SIZE = 25
+
+
+@st.cache_resource
+def get_openrouter_client(api_key: str) -> OpenRouterClient:
+    return OpenRouterClient(
+        {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        pool_size=max(HTTP_POOL_SIZE, MAX_PARALLEL_REQUESTS)
+    )
+
+
+@st.cache_resource
+def get_extractor(api_key: str, max_workers: int, chunk_tokens: int, table_fast_path: bool,
+                  route_tokens: int, streaming: bool, ocr: bool = True) -> PDFExtractorAgents:
+    return PDFExtractorAgents(
+        api_key,
+        max_workers=max_workers,
+        chunk_tokens=chunk_tokens,
+        table_fast_path=table_fast_path,
+        route_tokens=route_tokens,
+        streaming=streaming,
+        client=get_openrouter_client(api_key),
+        ocr=ocr
+    )
+
+
+@st.cache_data(max_entries=16)
+def planos_frame(versao: str, _result: Dict) -> pd.DataFrame:
+    return pd.DataFrame(_result.get("planos_precos", []))
+
+
+@st.cache_data(max_entries=16)
+def price_frame(versao: str, _result: Dict) -> pd.DataFrame:
+    return normalize_price_frame(_result.get("planos_precos", []))
+
+
+@st.cache_resource
+def start_metrics_server(port: int):
+    return pipeline.tracer.serve_prometheus(port)
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return JobQueue(api_key=OPENROUTER_API_KEY).start()
+
+
+JOB_STATUS_LABELS = {
+    "fila": "Na fila",
+    "processando": "Processando",
+    "concluido": "Concluído",
+    "falhou": "Falhou",
+    "cancelado": "Cancelado",
+}
+
+
+@st.fragment(run_every=2)
+def render_jobs(job_queue: JobQueue, cliente: str):
+    jobs = job_queue.list(cliente)
+    if not jobs:
+        return
+    st.markdown("Fila de Processamento")
+    for job in jobs:
+        col1, col2, col3, col4 = st.columns([3, 2, 3, 2])
+        with col1:
+            st.write(f"**{job['arquivo']}**")
+            st.caption(f"Job {job['id'][:8]} - {datetime.fromtimestamp(job['criado']).strftime('%d/%m %H:%M')}")
+        with col2:
+            st.write(JOB_STATUS_LABELS.get(job["status"], job["status"]))
+        with col3:
+            st.progress(int(job["progresso"] or 0), text=job["erro"] or job["mensagem"] or "")
+        with col4:
+            if job["status"] in JOB_ACTIVE_STATUSES:
+                if st.button("Cancelar", key=f"cancelar_{job['id']}"):
+                    job_queue.cancel(job["id"])
+                    st.rerun(scope="fragment")
+            elif job["status"] == "concluido":
+                if st.button("Ver resultado", key=f"ver_{job['id']}"):
+                    st.session_state["job_visualizado"] = job["id"]
+                    st.rerun()
+
+
+def render_store_query(store: ResultStore):
+    resumo = store.summary()
+    st.caption(
+        f"{resumo['documentos']} documentos, {resumo['planos']} planos e {resumo['precos']} preços "
+        "já extraídos; a consulta não chama o LLM."
+    )
+    if not resumo["documentos"]:
+        st.info("Nenhum resultado armazenado ainda. Extraia um PDF para começar.")
+        return
     
-    def extract_text_from_pdf(self, pdf_file) -> str:
-        try:
-            text = ""
-            with pdfplumber.open(pdf_file) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    page_text = page.extract_text(x_tolerance=1, y_tolerance=1)
-                    if page_text:
-                        text += f"\n=== PÁGINA {page_num} ===\n{page_text}\n"
-            return text
-        except Exception as e:
-            st.error(f"Erro ao extrair texto do PDF: {str(e)}")
-            return ""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        faixa = st.selectbox("Faixa Etária", FAIXAS_ETARIAS, index=len(FAIXAS_ETARIAS) - 1)
+        empresa = st.selectbox("Operadora", ["Todas"] + store.distinct("planos", "empresa"))
+    with col2:
+        acomodacao = st.selectbox("Acomodação", ["Todas", "Enfermaria", "Apartamento"])
+        vidas = st.selectbox("Vidas", ["Todas"] + store.distinct("planos", "segmentacao"))
+    with col3:
+        cidade = st.selectbox("Cidade da Rede", ["Todas"] + store.distinct("rede", "cidade"))
+        produto = st.text_input("Produto contém")
     
-    def call_openrouter_api(self, prompt: str, model: str = "qwen/qwen3-30b-a3b-instruct-2507") -> str:
-        
-        try:
-            payload = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 32768,
-                "temperature": 0.1
-            }
-            
-            response = requests.post(self.base_url, headers=self.headers, json=payload)
-            
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                st.error(f"Erro na API: {response.status_code} - {response.text}")
-                return ""
-                
-        except Exception as e:
-            st.error(f"Erro na chamada da API: {str(e)}")
-            return ""
+    started = time.perf_counter()
+    rows = store.search_prices(
+        faixa=faixa,
+        acomodacao=None if acomodacao == "Todas" else acomodacao,
+        vidas=None if vidas == "Todas" else _parse_vidas(vidas),
+        empresa=None if empresa == "Todas" else empresa,
+        produto=produto or None,
+        cidade=None if cidade == "Todas" else cidade,
+    )
+    elapsed = time.perf_counter() - started
+    st.caption(f"{len(rows)} planos em {elapsed * 1000:.1f} ms")
+    if rows:
+        melhor = rows[0]
+        st.metric(f"Menor preço ({faixa})", melhor["valor_texto"], delta=f"{melhor['produto']} - {melhor['empresa']}",
+                  delta_color="off")
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+
+def render_performance(trace_id: str):
+    spans = pipeline.tracer.spans_for(trace_id)
+    if not spans:
+        return
+    with st.expander("Performance"):
+        df_spans = pd.DataFrame(spans)
+        resumo = df_spans.groupby("stage")["segundos"].agg(["count", "sum", "max"]).sort_values("sum", ascending=False)
+        st.markdown("Tempo por Etapa")
+        st.dataframe(resumo, use_container_width=True)
+        colunas = [c for c in ["stage", "agent", "model", "segundos", "espera_rede", "primeiro_token", "geracao",
+                               "prompt_tokens", "completion_tokens", "retries", "cache_hit", "bytes_enviados",
+                               "bytes_recebidos"] if c in df_spans.columns]
+        st.markdown("Spans")
+        st.dataframe(df_spans[colunas], use_container_width=True)
+
+
+def render_preview(versao: str, result: Dict):
+    st.json({key: result.get(key) for key in DOCUMENT_FIELDS})
+    secoes = {
+        "Planos": (len(result.get("planos_precos", [])), lambda: result.get("planos_precos", [])),
+        "Tabelas de Valores": (len(result.get("tabelas_valores", [])), lambda: result.get("tabelas_valores", [])),
+        "Rede": (sum(len(info.get("lista", [])) for info in result.get("informacoes_gerais", [])),
+                 lambda: iter_rede_rows(result)),
+    }
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        secao = st.selectbox("Seção", list(secoes), key=f"preview_secao_{versao}")
+    total, records = secoes[secao]
+    with col2:
+        pagina = st.number_input(
+            "Página", min_value=1, max_value=max(1, -(-total // PREVIEW_PAGE_SIZE)), value=1,
+            key=f"preview_pagina_{versao}_{secao}"
+        )
+    start = (int(pagina) - 1) * PREVIEW_PAGE_SIZE
+    itens = list(itertools.islice(records(), start, start + PREVIEW_PAGE_SIZE))
+    if itens:
+        st.caption(f"Itens {start + 1}-{start + len(itens)} de {total}")
+        st.json(itens)
+    else:
+        st.caption("Nenhum item nesta seção.")
+
+
+def render_result(versao: str, result: Dict):
+    st.success("Extração concluída com sucesso!")
     
-    def agent_valores_completo(self, pdf_text: str) -> Dict:
-        prompt = f"""
-Você é um agente especializado em extrair TODOS os VALORES e PLANOS de documentos de planos de saúde.
-
-INSTRUÇÕES CRÍTICAS:
-- Extraia TODAS as tabelas de preços encontradas no PDF.
-- Inclua TODOS os planos, mesmo que tenham nomes semelhantes.
-- Extraia TODAS as segmentações (ex.: 01-29 vidas, 30-99 vidas).
-- Inclua TODOS os produtos e suas faixas etárias (00-18, 19-23, 24-28, ..., 59+).
-- Identifique TODAS as acomodações (Ambulatorial, Enfermaria, Apartamento).
-- NÃO omita nenhuma tabela, linha ou valor, mesmo que pareçam redundantes.
-- Cada linha de tabela deve ser um objeto independente no array `planos_precos`.
-- Indique claramente em qual página ou seção a informação foi encontrada.
-- Utilize exatamente os valores monetários ou percentuais como aparecem no PDF.
-- Extraia também observações, taxas e notas associadas aos preços.
-
-TEXTO COMPLETO DO PDF:
-{pdf_text}
-
-Retorne APENAS um JSON válido seguindo esta estrutura exata:
-{{
-    "empresa": "nome_detectado_ou_empresa_desconhecida",
-    "tipo_documento": "detectado_automaticamente",
-    "regional": "regiao_detectada_ou_nao_especificada",
-    "vigencia": {{"inicio": "data_ou_null", "fim": "data_ou_null"}},
-    "planos_precos": [
-        {{
-            "id": "uuid",
-            "produto": "nome_exato_do_plano",
-            "tabela_origem": "nome_da_tabela",
-            "posicao_na_pagina": "pagina_onde_encontrou",
-            "empresa": "detectada",
-            "tipo": "Ambulatorial_ou_Hospitalar_ou_Amb_Hosp_Obst",
-            "categoria": "PME_ou_MEI_ou_ADESAO_ou_PJ",
-            "segmentacao": "01_29_vidas_ou_30_99_vidas",
-            "registro_ans": "numero_registro_se_encontrado",
-            "acomodacao": "Enfermaria_Apartamento_ou_Nenhum",
-            "descricao": "descricao_completa_do_plano",
-            "valores_faixas": {{
-                "00-18": "R$_valor_exato",
-                "19-23": "R$_valor_exato",
-                "24-28": "R$_valor_exato",
-                "29-33": "R$_valor_exato",
-                "34-38": "R$_valor_exato",
-                "39-43": "R$_valor_exato",
-                "44-48": "R$_valor_exato",
-                "49-53": "R$_valor_exato",
-                "54-58": "R$_valor_exato",
-                "59+": "R$_valor_exato"
-            }},
-            "detalhes_adicionais": "informacoes_relevantes",
-            "observacoes": "notas_importantes"
-        }}
-    ]
-}}
-"""
-        response = self.call_openrouter_api(prompt)
-        try:
-            return json.loads(response)
-        except Exception as e:
-            st.error(f"Erro ao processar resposta do agente valores: {e}")
-            return {"empresa": "empresa_desconhecida", "planos_precos": []}
+    st.markdown("Resumo da Extração")
+    col1, col2, col3, col4 = st.columns(4)
     
-    def agent_coparticipacao_completo(self, pdf_text: str) -> Dict:
-       
-        import uuid
-        prompt = f"""
-Você é um agente especializado em extrair TODAS as COPARTICIPAÇÕES e TAXAS de documentos de planos de saúde.
-
-INSTRUÇÕES CRÍTICAS:
-- Extraia TODAS as tabelas de coparticipação e taxas encontradas.
-- Inclua valores para:
-  - Consultas (eletiva, telemedicina, urgência/emergência)
-  - Exames (simples, especiais, complexos)
-  - Terapias (simples, especiais)
-  - Procedimentos ambulatoriais
-  - Internações (enfermaria, apartamento)
-  - Taxas administrativas (taxa de adesão, cadastro, etc.)
-- Capture tanto valores fixos quanto percentuais (%)
-- Se houver limites por valor (ex.: “30% limitado a R$ 146,20”), capture percentual e limite
-- Relacione cada tabela de coparticipação aos produtos correspondentes (extraídos pelo agente de valores)
-- Não omita nenhuma linha, mesmo que repetida
-
-TEXTO COMPLETO DO PDF:
-{pdf_text}
-
-Retorne APENAS um JSON válido seguindo esta estrutura:
-{{
-    "tabelas_valores": [
-        {{
-            "id": "{str(uuid.uuid4())}",
-            "tabela_origem": "identificador_da_tabela",
-            "tipo": "coparticipacao_ambulatorial_ou_hospitalar_ou_taxas",
-            "descricao": "descricao_detalhada_da_tabela",
-            "aplica_produtos": ["lista_de_produtos_relacionados"],
-            "valores": {{
-                "consulta_eletiva": "valor_exato",
-                "consulta_telemedicina": "valor_exato",
-                "consulta_urgencia": "valor_exato",
-                "exames_simples": "valor_ou_percentual",
-                "exames_especiais": "valor_ou_percentual",
-                "terapia_simples": "valor_ou_percentual",
-                "terapia_especial": "valor_ou_percentual",
-                "procedimentos_ambulatoriais": "valor_ou_percentual",
-                "internacao_enfermaria": "valor_exato_ou_percentual",
-                "internacao_apartamento": "valor_exato_ou_percentual",
-                "taxa_adesao": "valor_exato_ou_null"
-            }},
-            "observacoes": "detalhes_importantes_extras"
-        }}
-    ]
-}}
-"""
-        response = self.call_openrouter_api(prompt)
-        try:
-            return json.loads(response)
-        except Exception as e:
-            st.error(f"Erro ao processar resposta do agente coparticipação: {e}")
-            return {"tabelas_valores": []}
-
+    with col1:
+        st.metric("Empresa", result.get("empresa", "N/A"))
     
-    def agent_rede_credenciada_completo(self, pdf_text: str) -> Dict:
-
-        prompt = f"""
-Você é um agente especializado em extrair TODAS as informações sobre REDE CREDENCIADA de documentos de planos de saúde.
-
-INSTRUÇÕES CRÍTICAS:
-- Extraia TODOS os hospitais, clínicas, laboratórios e outros estabelecimentos citados
-- Inclua todos os endereços, contatos e especialidades sempre que disponíveis
-- Relacione cada estabelecimento aos produtos/plans em que está disponível (extraídos pelo agente de valores)
-- Classifique cada item por tipo: hospital, clínica, laboratório, pronto-atendimento, consultório, etc.
-- Indique se é “rede credenciada” ou “rede própria”
-- Inclua cidade e região mencionadas
-- Se não houver rede listada, retorne um JSON válido vazio, mas mantenha a estrutura
-- Verifique TODAS as páginas, mesmo em notas de rodapé ou anexos
-
-TEXTO COMPLETO DO PDF:
-{pdf_text}
-
-Retorne APENAS um JSON válido seguindo esta estrutura:
-{{
-    "informacoes_gerais": [
-        {{
-            "tipo": "hospitais_ou_clinicas_ou_laboratorios_ou_outros",
-            "categoria": "rede_credenciada_ou_rede_propria",
-            "regiao": "regiao_detectada",
-            "lista": [
-                {{
-                    "nome": "nome_exato_do_estabelecimento",
-                    "cidade": "cidade_detectada",
-                    "detalhes": "informacoes_adicionais_e_especialidades",
-                    "endereco": "endereco_completo_se_disponivel",
-                    "contato": "telefone_email_ou_null",
-                    "produtos_disponiveis": ["lista_de_produtos"],
-                    "disponibilidade_por_produto": {{
-                        "produto_x": "disponivel_ou_nao_disponivel",
-                        "produto_y": "disponivel_ou_nao_disponivel"
-                    }}
-                }}
-            ]
-        }}
-    ]
-}}
-"""
-        response = self.call_openrouter_api(prompt)
-        try:
-            return json.loads(response)
-        except Exception as e:
-            st.error(f"Erro ao processar resposta do agente rede: {e}")
-            return {"informacoes_gerais": []}
-
-    def process_pdf_completo(self, pdf_file, page_number: int = 1) -> Dict:
-        
-        pdf_text = self.extract_text_from_pdf(pdf_file)
-        
-        if not pdf_text:
-            return {}
-        
-        result = {
-            "pagina": page_number,
-            "empresa": "empresa_desconhecida",
-            "tipo_documento": "detectado_automaticamente",
-            "regional": "nao_especificada",
-            "vigencia": {"inicio": None, "fim": None},
-            "tipo_pagina": "precos_ou_informativa",
-            "planos_precos": [],
-            "tabelas_valores": [],
-            "informacoes_gerais": []
-        }
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        col1, col2, col3 = st.columns(3)
-        
+    with col2:
+        planos_count = len(result.get("planos_precos", []))
+        st.metric("Total de Planos", planos_count, delta=f"+{planos_count} extraídos")
+    
+    with col3:
+        tabelas_count = len(result.get("tabelas_valores", []))
+        st.metric("Tabelas de Valores", tabelas_count, delta=f"+{tabelas_count} extraídas")
+    
+    with col4:
+        rede_count = sum(len(info.get("lista", [])) for info in result.get("informacoes_gerais", []))
+        st.metric("Estabelecimentos", rede_count, delta=f"+{rede_count} mapeados")
+    
+    alteracoes = result.get("alteracoes")
+    if alteracoes:
+        st.markdown("Alterações em Relação à Versão Anterior")
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.markdown("Valores Completo")
-            agent1_status = st.empty()
-            agent1_count = st.empty()
-            agent1_status.info("Aguardando...")
-        
+            st.metric("Páginas Reprocessadas", len(alteracoes["paginas_reprocessadas"]))
         with col2:
-            st.markdown("Coparticipação Completo")
-            agent2_status = st.empty()
-            agent2_count = st.empty()
-            agent2_status.info("Aguardando...")
-        
+            st.metric("Páginas Reaproveitadas", alteracoes["paginas_reaproveitadas"])
         with col3:
-            st.markdown("Rede Credenciada Completo")
-            agent3_status = st.empty()
-            agent3_count = st.empty()
-            agent3_status.info("Aguardando...")
-        
-        status_text.text("A1 valores e planos...")
-        agent1_status.warning("Processando as tabelas...")
-        progress_bar.progress(25)
-        agent1_result = self.agent_valores_completo(pdf_text)
-        
-        planos_count = len(agent1_result.get("planos_precos", []))
-        agent1_count.metric("Planos Extraídos", planos_count)
-        agent1_status.success("Concluído")
-        
-        status_text.text("A2 coparticipações...")
-        agent2_status.warning("Processando todas as taxas...")
-        progress_bar.progress(50)
-        agent2_result = self.agent_coparticipacao_completo(pdf_text)
-        
-        copart_count = len(agent2_result.get("tabelas_valores", []))
-        agent2_count.metric("Tabelas de Valores", copart_count)
-        agent2_status.success("Concluído")
-        
-        status_text.text("A3 rede credenciada...")
-        agent3_status.warning("Processando toda a rede...")
-        progress_bar.progress(75)
-        agent3_result = self.agent_rede_credenciada_completo(pdf_text)
-        
-        rede_count = sum(len(info.get("lista", [])) for info in agent3_result.get("informacoes_gerais", []))
-        agent3_count.metric("Estabelecimentos", rede_count)
-        agent3_status.success("Concluído")
-        
-        status_text.text("Combinando resultados...")
-        progress_bar.progress(100)
-        
-        if agent1_result:
-            result.update({
-                "empresa": agent1_result.get("empresa", "empresa_desconhecida"),
-                "tipo_documento": agent1_result.get("tipo_documento", "detectado_automaticamente"),
-                "regional": agent1_result.get("regional", "nao_especificada"),
-                "vigencia": agent1_result.get("vigencia", {"inicio": None, "fim": None}),
-                "planos_precos": agent1_result.get("planos_precos", [])
-            })
-        
-        if agent2_result:
-            result["tabelas_valores"] = agent2_result.get("tabelas_valores", [])
-        
-        if agent3_result:
-            result["informacoes_gerais"] = agent3_result.get("informacoes_gerais", [])
-        
-        progress_bar.empty()
-        status_text.empty()
+            st.metric("Planos Alterados", len(alteracoes["planos_precos"]["adicionados"]),
+                      delta=f"-{len(alteracoes['planos_precos']['removidos'])} removidos", delta_color="off")
+        with col4:
+            st.metric("Campos Alterados", ", ".join(alteracoes["campos_alterados"]) or "nenhum")
+        with st.expander("Relatório de alterações"):
+            st.json(alteracoes)
+    
+    st.markdown("Detalhamento da Extração")
+    
+    if result.get("planos_precos"):
+        st.markdown("Planos Extraídos por Categoria")
+        df_planos = planos_frame(versao, result)
         
-        return result
-
-def main():
-    st.title("PDF to JSON")
-    with st.sidebar:
-        st.header("Configurações")
-        page_number = st.number_input("Número da Página Inicial", min_value=1, value=1)
-    extractor = PDFExtractorAgents(OPENROUTER_API_KEY)
+        if not df_planos.empty:
+            if 'produto' in df_planos.columns:
+                produtos_count = df_planos['produto'].value_counts()
+                st.write("**Distribuição por Produto:**")
+                for produto, count in produtos_count.items():
+                    st.write(f"- **{produto}**: {count} tabelas")
+            
+            if 'segmentacao' in df_planos.columns:
+                seg_count = df_planos['segmentacao'].value_counts()
+                st.write("**Distribuição por Segmentação:**")
+                for seg, count in seg_count.items():
+                    st.write(f"- **{seg}**: {count} planos")
     
-    uploaded_file = st.file_uploader(
-        "Faça upload do PDF do plano de saúde",
-        type=['pdf'],
-        help="Sistema otimizado para extrair TODAS as informações de documentos de planos de saúde"
-    )
+    st.markdown("JSON Resultante")
+    render_preview(versao, result)
+    
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    with col1:
+        st.download_button(
+            label="Baixar JSON COMPLETO",
+            data=lambda: export_json(result),
+            file_name=f"plano_saude_COMPLETO_{stamp}.json",
+            mime="application/json",
+            key=f"json_{versao}"
+        )
+    
+    with col2:
+        st.download_button(
+            label="NDJSON por registro",
+            data=lambda: export_ndjson(result),
+            file_name=f"plano_saude_registros_{stamp}.ndjson",
+            mime="application/x-ndjson",
+            key=f"ndjson_{versao}"
+        )
+    
+    with col3:
+        if result.get("planos_precos"):
+            st.download_button(
+                label="CSV Planos COMPLETO",
+                data=lambda: export_planos_csv(result),
+                file_name=f"planos_COMPLETO_{stamp}.csv",
+                mime="text/csv",
+                key=f"planos_csv_{versao}"
+            )
+    
+    with col4:
+        if result.get("planos_precos"):
+            st.download_button(
+                label="Parquet Planos",
+                data=lambda: export_planos_parquet(result),
+                file_name=f"planos_{stamp}.parquet",
+                mime="application/vnd.apache.parquet",
+                key=f"planos_parquet_{versao}",
+                disabled=not parquet_available(),
+                help=None if parquet_available() else "Instale o pyarrow para exportar em Parquet"
+            )
+    
+    with col5:
+        if any(info.get("lista") for info in result.get("informacoes_gerais", [])):
+            st.download_button(
+                label="CSV Rede COMPLETA",
+                data=lambda: export_rede_csv(result),
+                file_name=f"rede_credenciada_COMPLETA_{stamp}.csv",
+                mime="text/csv",
+                key=f"rede_csv_{versao}"
+            )
     
-    if uploaded_file is not None:
-        file_details = {
-            "Nome": uploaded_file.name,
-            "Tamanho": f"{uploaded_file.size / 1024 / 1024:.2f} MB",
-            "Tipo": uploaded_file.type
-        }
+    if result.get("planos_precos"):
+        st.markdown("Análise Estatística COMPLETA (Pandas & NumPy)")
         
-        st.info("Informações do Arquivo:")
-        for key, value in file_details.items():
-            st.write(f"**{key}:** {value}")
+        df_planos = planos_frame(versao, result)
         
-        if st.button("EXTRAIR", type="primary"):
-            with st.spinner("Processando PDF com extração COMPLETA..."):
+        if not df_planos.empty:
+            
+            st.markdown("Tabela Completa de Planos")
+            st.dataframe(df_planos, use_container_width=True)
+            
+            if 'valores_faixas' in df_planos.columns:
+                st.markdown("Análise de Valores por Faixa Etária")
                 
-                result = extractor.process_pdf_completo(uploaded_file, page_number)
+                df_valores = price_frame(versao, result)
+                df_reais = df_valores[df_valores['unidade'] == 'R$']
                 
-                if result:
-                    st.success("Extração concluída com sucesso!")
+                if not df_reais.empty:
+                    st.dataframe(df_valores, use_container_width=True)
                     
-                    st.markdown("Resumo da Extração")
-                    col1, col2, col3, col4 = st.columns(4)
+                    stats = price_statistics(df_reais)
                     
+                    col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        st.metric("Empresa", result.get("empresa", "N/A"))
-                    
+                        st.metric("Média", f"R$ {stats['media']:.2f}")
                     with col2:
-                        planos_count = len(result.get("planos_precos", []))
-                        st.metric("Total de Planos", planos_count, delta=f"+{planos_count} extraídos")
-                    
+                        st.metric("Mediana", f"R$ {stats['mediana']:.2f}")
                     with col3:
-                        tabelas_count = len(result.get("tabelas_valores", []))
-                        st.metric("Tabelas de Valores", tabelas_count, delta=f"+{tabelas_count} extraídas")
-                    
+                        st.metric("Menor Valor", f"R$ {stats['minimo']:.2f}")
                     with col4:
-                        rede_count = sum(len(info.get("lista", [])) for info in result.get("informacoes_gerais", []))
-                        st.metric("Estabelecimentos", rede_count, delta=f"+{rede_count} mapeados")
-                    
-                    st.markdown("Detalhamento da Extração")
+                        st.metric("Maior Valor", f"R$ {stats['maximo']:.2f}")
                     
-                    if result.get("planos_precos"):
-                        st.markdown("Planos Extraídos por Categoria")
-                        df_planos = pd.DataFrame(result["planos_precos"])
-                        
-                        if not df_planos.empty:
-                            if 'produto' in df_planos.columns:
-                                produtos_count = df_planos['produto'].value_counts()
-                                st.write("**Distribuição por Produto:**")
-                                for produto, count in produtos_count.items():
-                                    st.write(f"- **{produto}**: {count} tabelas")
-                            
-                            if 'segmentacao' in df_planos.columns:
-                                seg_count = df_planos['segmentacao'].value_counts()
-                                st.write("**Distribuição por Segmentação:**")
-                                for seg, count in seg_count.items():
-                                    st.write(f"- **{seg}**: {count} planos")
+                    st.write(f"**Desvio Padrão:** R$ {stats['desvio_padrao']:.2f}")
+                    st.write(f"**Total de Valores Extraídos:** {stats['total']}")
                     
-                    st.markdown("JSON COMPLETO Resultante")
-                    json_str = json.dumps(result, ensure_ascii=False, indent=2)
-                    st.code(json_str, language='json')
-                    
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.download_button(
-                            label="Baixar JSON COMPLETO",
-                            data=json_str,
-                            file_name=f"plano_saude_COMPLETO_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                            mime="application/json"
-                        )
-                    
-                    with col2:
-                        if result.get("planos_precos"):
-                            df_planos = pd.DataFrame(result["planos_precos"])
-                            csv = df_planos.to_csv(index=False)
-                            st.download_button(
-                                label="CSV Planos COMPLETO",
-                                data=csv,
-                                file_name=f"planos_COMPLETO_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                mime="text/csv"
-                            )
-                    
-                    with col3:
-                        if result.get("informacoes_gerais"):
-                            rede_data = []
-                            for info in result["informacoes_gerais"]:
-                                for item in info.get("lista", []):
-                                    item_copy = item.copy()
-                                    item_copy["tipo"] = info.get("tipo", "")
-                                    item_copy["categoria"] = info.get("categoria", "")
-                                    rede_data.append(item_copy)
-                            
-                            if rede_data:
-                                df_rede = pd.DataFrame(rede_data)
-                                csv_rede = df_rede.to_csv(index=False)
-                                st.download_button(
-                                    label="CSV Rede COMPLETA",
-                                    data=csv_rede,
-                                    file_name=f"rede_credenciada_COMPLETA_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                    mime="text/csv"
-                                )
-                    
-                    if result.get("planos_precos"):
-                        st.markdown("Análise Estatística COMPLETA (Pandas & NumPy)")
-                        
-                        df_planos = pd.DataFrame(result["planos_precos"])
-                        
-                        if not df_planos.empty:
-                            
-                            st.markdown("Tabela Completa de Planos")
-                            st.dataframe(df_planos, use_container_width=True)
-                            
-                            if 'valores_faixas' in df_planos.columns:
-                                st.markdown("Análise de Valores por Faixa Etária")
-                                
-                                valores_numericos = []
-                                for idx, row in df_planos.iterrows():
-                                    if isinstance(row['valores_faixas'], dict):
-                                        for faixa, valor in row['valores_faixas'].items():
-                                            numeros = re.findall(r'[\d,]+\.?\d*', str(valor))
-                                            if numeros:
-                                                try:
-                                                    valor_num = float(numeros[0].replace(',', ''))
-                                                    valores_numericos.append({
-                                                        'produto': row.get('produto', 'N/A'),
-                                                        'tipo': row.get('tipo', 'N/A'),
-                                                        'segmentacao': row.get('segmentacao', 'N/A'),
-                                                        'acomodacao': row.get('acomodacao', 'N/A'),
-                                                        'tabela_origem': row.get('tabela_origem', 'N/A'),
-                                                        'faixa_etaria': faixa,
-                                                        'valor': valor_num
-                                                    })
-                                                except:
-                                                    pass
-                                
-                                if valores_numericos:
-                                    df_valores = pd.DataFrame(valores_numericos)
-                                    st.dataframe(df_valores, use_container_width=True)
-                                    
-                                    valores_array = np.array(df_valores['valor'])
-                                    
-                                    col1, col2, col3, col4 = st.columns(4)
-                                    with col1:
-                                        st.metric("Média", f"R$ {np.mean(valores_array):.2f}")
-                                    with col2:
-                                        st.metric("Mediana", f"R$ {np.median(valores_array):.2f}")
-                                    with col3:
-                                        st.metric("Menor Valor", f"R$ {np.min(valores_array):.2f}")
-                                    with col4:
-                                        st.metric("Maior Valor", f"R$ {np.max(valores_array):.2f}")
-                                    
-                                    st.write(f"**Desvio Padrão:** R$ {np.std(valores_array):.2f}")
-                                    st.write(f"**Total de Valores Extraídos:** {len(valores_array)}")
+                    st.markdown("Estatísticas por Faixa Etária")
+                    st.dataframe(stats['por_faixa'], use_container_width=True)
+                    st.markdown("Valor Médio por Produto e Faixa Etária")
+                    st.dataframe(stats['por_produto'], use_container_width=True)
+
+
+def main():
+    setup_logging()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    st.title("PDF to JSON")
+    with st.sidebar:
+        st.header("Configurações")
+        page_number = st.number_input("Número da Página Inicial", min_value=1, value=1)
+        max_workers = st.number_input("Requisições em Paralelo", min_value=1, max_value=MAX_PARALLEL_REQUESTS, value=MAX_CONCURRENT_AGENTS)
+        chunked = st.checkbox("Modo em blocos (PDFs grandes)", value=False)
+        chunk_tokens = st.number_input("Tokens por bloco", min_value=1000, value=CHUNK_TOKEN_BUDGET, step=1000, disabled=not chunked)
+        table_fast_path = st.checkbox("Ler tabelas de preço direto do PDF", value=True)
+        routing = st.checkbox("Enviar a cada agente só as páginas relevantes", value=True)
+        route_tokens = st.number_input("Orçamento de tokens por agente", min_value=0, value=ROUTING_TOKEN_BUDGET, step=1000, disabled=not routing, help="0 = sem limite")
+        streaming = st.checkbox("Resultados em tempo real (streaming)", value=True)
+        ocr = st.checkbox(
+            "OCR em páginas digitalizadas", value=True, disabled=not ocr_available(),
+            help=None if ocr_available() else "Instale o Tesseract e o pytesseract para ativar o OCR"
+        )
+        parse_stats = st.empty()
+        cache_stats = st.empty()
+        model_stats = st.empty()
+    opcoes = {
+        "max_workers": int(max_workers),
+        "chunk_tokens": int(chunk_tokens) if chunked else 0,
+        "table_fast_path": table_fast_path,
+        "route_tokens": int(route_tokens) if routing else None,
+        "streaming": streaming,
+        "ocr": ocr,
+    }
+    extractor = get_extractor(OPENROUTER_API_KEY, **opcoes)
+    job_queue = get_job_queue()
+    resultados = st.session_state.setdefault("resultados", {})
+    cliente = st.query_params.get("cliente")
+    if not cliente:
+        cliente = uuid.uuid4().hex
+        st.query_params["cliente"] = cliente
+    
+    aba_extracao, aba_consulta = st.tabs(["Extração", "Consultar Planos"])
+    
+    with aba_consulta:
+        render_store_query(extractor.store)
+    
+    with aba_extracao:
+        uploaded_file = st.file_uploader(
+            "Faça upload do PDF do plano de saúde",
+            type=['pdf'],
+            help="Sistema otimizado para extrair TODAS as informações de documentos de planos de saúde"
+        )
+    
+        previous_file = st.file_uploader(
+            "JSON da versão anterior (opcional)",
+            type=['json'],
+            help="Reprocessa apenas as páginas que mudaram desde a extração anterior deste documento"
+        )
+        previous = None
+        if previous_file is not None:
+            try:
+                previous = json.loads(previous_file.getvalue())
+            except ValueError:
+                pass
+            if not isinstance(previous, dict):
+                st.error("JSON da versão anterior inválido; o documento será extraído por completo.")
+                previous, previous_file = None, None
+    
+        if uploaded_file is not None:
+            upload_hash = content_hash(uploaded_file.getvalue())
+            if previous_file is not None:
+                upload_hash = content_hash(upload_hash + content_hash(previous_file.getvalue()))
+            file_details = {
+                "Nome": uploaded_file.name,
+                "Tamanho": f"{uploaded_file.size / 1024 / 1024:.2f} MB",
+                "Tipo": uploaded_file.type
+            }
+        
+            st.info("Informações do Arquivo:")
+            for key, value in file_details.items():
+                st.write(f"**{key}:** {value}")
+        
+            col_extrair, col_fila = st.columns(2)
+            with col_fila:
+                if st.button("ENVIAR PARA A FILA", help="Processa em segundo plano; você pode fechar a aba e voltar depois"):
+                    job_id = job_queue.submit(cliente, uploaded_file.name, uploaded_file.getvalue(),
+                                              dict(opcoes, page_number=int(page_number)))
+                    st.success(f"Job {job_id[:8]} enviado para a fila.")
+        
+            if col_extrair.button("EXTRAIR", type="primary"):
+                with st.spinner("Processando PDF com extração COMPLETA..."):
                 
-                else:
-                    st.error("Erro ao processar o PDF. Tente novamente.")
+                    trace_id = uuid.uuid4().hex
+                    result = extractor.process_pdf_completo(
+                        uploaded_file, page_number, progress=StreamlitProgress(), trace_id=trace_id, previous=previous
+                    )
+                
+                    if result:
+                        resultados[upload_hash] = {"versao": uuid.uuid4().hex, "resultado": result, "trace_id": trace_id}
+                    else:
+                        st.error("Erro ao processar o PDF. Tente novamente.")
+        
+            if upload_hash in resultados:
+                entry = resultados[upload_hash]
+                pipeline.tracer.bind(entry["trace_id"])
+                with pipeline.tracer.span("render"):
+                    render_result(entry["versao"], entry["resultado"])
+                render_performance(entry["trace_id"])
+    
+        render_jobs(job_queue, cliente)
+    
+        job_visualizado = st.session_state.get("job_visualizado")
+        if job_visualizado:
+            job_result = job_queue.result(job_visualizado)
+            if job_result:
+                st.markdown(f"Resultado do Job {job_visualizado[:8]}")
+                render_result(job_visualizado, job_result)
+                render_performance(job_visualizado)
+    
+    if extractor.parse_stats:
+        with parse_stats.container():
+            st.markdown("Respostas dos Agentes")
+            respostas = sum(v for k, v in extractor.parse_stats.items() if k != "continuacao")
+            validas = sum(extractor.parse_stats.get(k, 0) for k in ("ok", "reparado", "continuado"))
+            st.write(f"**Taxa de sucesso:** {validas / respostas:.0%} de {respostas}" if respostas else "")
+            for status, count in sorted(extractor.parse_stats.items()):
+                st.write(f"**{status}:** {count}")
+    
+    modelos = extractor.model_router.snapshot()["modelos"]
+    if modelos:
+        with model_stats.container():
+            st.markdown("Modelos")
+            for model, stats in sorted(modelos.items()):
+                st.write(
+                    f"**{model}:** {stats['chamadas']} chamadas, {stats['falhas']} falhas, "
+                    f"{stats['latencia']:.1f}s, US$ {stats['custo_total']:.4f}"
+                )
+    
+    if extractor.cache.stats:
+        with cache_stats.container():
+            st.markdown("Cache")
+            for namespace, counters in extractor.cache.stats.items():
+                st.write(
+                    f"**{namespace}:** {counters['hits_memoria']} memória / "
+                    f"{counters['hits_disco']} disco / {counters['misses']} misses"
+                )
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "compare-tables":
+        sys.exit(compare_tables_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-prices":
+        sys.exit(bench_prices_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "store":
+        sys.exit(store_main(sys.argv[2:]))
     main()
\ No newline at end of file
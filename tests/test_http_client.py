@@ -0,0 +1,174 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import pipeline
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests.append(time.monotonic())
+            server.peers.add(self.client_address)
+            status, headers, delay = server.responses.pop(0) if server.responses else (200, {}, 0)
+        if delay:
+            threading.Event().wait(delay)
+        body = json.dumps({"choices": [{"message": {"content": "{}"}}]}).encode("utf-8")
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.peers = set()
+    server.responses = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pipeline.time, "sleep", delays.append)
+    return delays
+
+
+def make_client(**kwargs):
+    kwargs.setdefault("rate_limiter", pipeline.RateLimiter(60000, burst=1000))
+    return pipeline.OpenRouterClient({"Content-Type": "application/json"}, **kwargs)
+
+
+def test_retry_after_seconds(stub, sleeps):
+    stub.responses = [(429, {"Retry-After": "7"}, 0)]
+    response = make_client().post(stub.url, {"model": "m"})
+    assert response.status_code == 200
+    assert response.retry_count == 1
+    assert len(stub.requests) == 2
+    assert sleeps == [7.0]
+
+
+def test_retry_after_http_date(stub, sleeps):
+    stub.responses = [(429, {"Retry-After": formatdate(time.time() + 30, usegmt=True)}, 0)]
+    response = make_client().post(stub.url, {"model": "m"})
+    assert response.status_code == 200
+    assert len(sleeps) == 1 and 25 <= sleeps[0] <= 30
+
+
+def test_retry_after_is_capped(stub, sleeps):
+    stub.responses = [(503, {"Retry-After": "3600"}, 0)]
+    make_client().post(stub.url, {"model": "m"})
+    assert sleeps == [pipeline.HTTP_BACKOFF_MAX]
+
+
+def test_server_errors_back_off_until_max_retries(stub, sleeps):
+    stub.responses = [(503, {}, 0)] * 10
+    response = make_client(max_retries=3).post(stub.url, {"model": "m"})
+    assert response.status_code == 503
+    assert response.retry_count == 3
+    assert len(stub.requests) == 4
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= pipeline.HTTP_BACKOFF_BASE * 2 ** attempt
+
+
+def test_client_errors_are_not_retried(stub, sleeps):
+    stub.responses = [(400, {}, 0)]
+    response = make_client().post(stub.url, {"model": "m"})
+    assert response.status_code == 400
+    assert len(stub.requests) == 1
+    assert sleeps == []
+
+
+def test_read_timeout_is_retried(stub, sleeps):
+    stub.responses = [(200, {}, 0.5)]
+    response = make_client(read_timeout=0.2).post(stub.url, {"model": "m"})
+    assert response.status_code == 200
+    assert response.retry_count == 1
+    assert len(stub.requests) == 2
+
+
+def test_read_timeout_without_retry(stub, sleeps):
+    stub.responses = [(200, {}, 0.5)] * 3
+    with pytest.raises(requests.Timeout):
+        make_client().post(stub.url, {"model": "m"}, read_timeout=0.2, retry_timeouts=False)
+    assert len(stub.requests) == 1
+
+
+def test_connect_timeout_gives_up_after_max_retries(sleeps):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    backlog = []
+    for _ in range(3):
+        conn = socket.socket()
+        conn.setblocking(False)
+        conn.connect_ex(("127.0.0.1", port))
+        backlog.append(conn)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            make_client(connect_timeout=0.2, max_retries=2).post(f"http://127.0.0.1:{port}/", {"model": "m"})
+        assert len(sleeps) == 2
+    finally:
+        for conn in backlog:
+            conn.close()
+        listener.close()
+
+
+def test_rate_limiter_is_shared_by_concurrent_callers(stub):
+    client = make_client(rate_limiter=pipeline.RateLimiter(600, burst=2))
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(lambda _: client.post(stub.url, {"model": "m"}).status_code, range(8)))
+    elapsed = time.monotonic() - started
+    assert statuses == [200] * 8
+    assert elapsed >= 0.55
+    gaps = [b - a for a, b in zip(stub.requests[2:], stub.requests[3:])]
+    assert all(gap >= 0.05 for gap in gaps)
+
+
+def test_client_reuses_pooled_connections(stub):
+    client = make_client()
+    for _ in range(3):
+        client.post(stub.url, {"model": "m"})
+    assert len(stub.requests) == 3
+    assert len(stub.peers) == 1
+
+
+def test_retried_responses_release_their_connection(stub, sleeps):
+    stub.responses = [(429, {"Retry-After": "0"}, 0)] * 3 + [(503, {}, 0)] * 2
+    client = make_client(max_retries=5)
+    response = client.post(stub.url, {"model": "m"}, stream=True)
+    assert response.status_code == 200
+    assert len(stub.requests) == 6
+    assert len(stub.peers) == 1
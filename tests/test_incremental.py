@@ -0,0 +1,102 @@
+import pytest
+
+import pipeline
+
+
+@pytest.mark.parametrize("posicao, pages", [
+    ("Página 5 - Tabela 2", {5}),
+    ("Tabela 2 da página 4", {4}),
+    ("Página 5, linha 3", {5}),
+    ("páginas 3 a 5 e 8", {3, 4, 5, 8}),
+    ("pág. 7, 9", {7, 9}),
+    ("pgs. 10–12", {10, 11, 12}),
+    ("Pag 12", {12}),
+    ("5", {5}),
+    ("3-5", {3, 4, 5}),
+    ("linha 3", set()),
+    ("Tabela 2", set()),
+    ("", set()),
+    (None, set()),
+    ("páginas 1-9999", {1, 9999}),
+])
+def test_cited_pages(posicao, pages):
+    assert pipeline.cited_pages(posicao) == pages
+
+
+@pytest.mark.parametrize("posicao, expected", [
+    ("Página 5 - Tabela 2", "Página 6 - Tabela 2"),
+    ("Tabela 2 da página 4", "Tabela 2 da página 40"),
+    ("páginas 3 a 5 e 8", "páginas 30 a 6 e 8"),
+    ("5", "6"),
+    ("linha 2", "linha 2"),
+])
+def test_renumber_posicao(posicao, expected):
+    moved = {5: 6, 2: 20, 4: 40, 3: 30}
+    assert pipeline._renumber_posicao({"posicao_na_pagina": posicao}, moved)["posicao_na_pagina"] == expected
+
+
+@pytest.mark.parametrize("previous, current, expected", [
+    (
+        {"1": "a", "2": "b", "3": "c"}, {"1": "a", "2": "b", "3": "c"},
+        {"alteradas": [], "descartadas": [], "movidas": {}, "reaproveitadas": 3},
+    ),
+    (
+        {"1": "a", "2": "b", "3": "c"}, {"1": "a", "2": "x", "3": "c"},
+        {"alteradas": [2], "descartadas": [2], "movidas": {}, "reaproveitadas": 2},
+    ),
+    (
+        {"1": "a", "2": "b", "3": "c"}, {"1": "a", "2": "n", "3": "b", "4": "c"},
+        {"alteradas": [2], "descartadas": [], "movidas": {2: 3, 3: 4}, "reaproveitadas": 3},
+    ),
+    (
+        {"1": "a", "2": "b", "3": "c"}, {"1": "a", "2": "c"},
+        {"alteradas": [], "descartadas": [2], "movidas": {3: 2}, "reaproveitadas": 2},
+    ),
+    (
+        {"1": "a", "2": "a"}, {"1": "a", "2": "a", "3": "a"},
+        {"alteradas": [3], "descartadas": [], "movidas": {}, "reaproveitadas": 2},
+    ),
+])
+def test_diff_pages(previous, current, expected):
+    assert pipeline.diff_pages(previous, current) == expected
+
+
+PREVIOUS = {
+    "empresa": "X",
+    "planos_precos": [
+        {"produto": "A", "posicao_na_pagina": "Página 2 - Tabela 3"},
+        {"produto": "B", "posicao_na_pagina": "página 3"},
+    ],
+    "tabelas_valores": [{"tipo": "copart", "posicao_na_pagina": "1"}],
+    "informacoes_gerais": [
+        {"tipo": "h", "lista": [{"nome": "H", "posicao_na_pagina": "pág. 3"}, {"nome": "I", "posicao_na_pagina": "2"}]},
+        {"tipo": "c", "lista": [{"nome": "C", "posicao_na_pagina": "3"}]},
+    ],
+}
+DIFF = {"alteradas": [4], "descartadas": [3], "movidas": {2: 5}, "reaproveitadas": 2}
+
+
+def test_previous_partials_drop_discarded_and_renumber_moved_pages():
+    partials = pipeline.previous_partials(PREVIOUS, DIFF)
+    assert partials["valores"] == {
+        "planos_precos": [{"produto": "A", "posicao_na_pagina": "Página 5 - Tabela 3"}],
+        "empresa": "X",
+    }
+    assert partials["coparticipacao"] == {"tabelas_valores": [{"tipo": "copart", "posicao_na_pagina": "1"}]}
+    assert partials["rede"] == {
+        "informacoes_gerais": [{"tipo": "h", "lista": [{"nome": "I", "posicao_na_pagina": "5"}]}]
+    }
+
+
+def test_previous_partials_without_page_citation_rerun_the_agent():
+    previous = dict(PREVIOUS, planos_precos=[{"produto": "A", "posicao_na_pagina": "Tabela 2"}])
+    partials = pipeline.previous_partials(previous, DIFF)
+    assert partials["valores"] is None
+    assert partials["coparticipacao"] is not None
+
+
+def test_page_hashes_ignore_whitespace():
+    first = pipeline.page_hashes("\n=== PÁGINA 1 ===\nTabela  de\npreços\n\n=== PÁGINA 2 ===\nRede\n")
+    second = pipeline.page_hashes("\n=== PÁGINA 1 ===\nTabela de preços\n\n=== PÁGINA 2 ===\nRede credenciada\n")
+    assert first["1"] == second["1"]
+    assert first["2"] != second["2"]
@@ -0,0 +1,107 @@
+import pytest
+
+import pipeline
+
+
+@pytest.mark.parametrize("text, expected, status", [
+    ('{"planos_precos": []}', {"planos_precos": []}, "ok"),
+    ('```json\n{"planos_precos": [{"produto": "A"},],}\n```', {"planos_precos": [{"produto": "A"}]}, "reparado"),
+    ('```\n{"empresa": "X"}\n```', {"empresa": "X"}, "reparado"),
+    ('Segue o JSON: {"empresa": "X", "vigencia": {"inicio": null,},} Obrigado.', {"empresa": "X", "vigencia": {"inicio": None}}, "reparado"),
+    ('{"descricao": "linha 1\nlinha 2"}', {"descricao": "linha 1\nlinha 2"}, "reparado"),
+    ("", None, "vazio"),
+    ("   \n", None, "vazio"),
+    ("isto não é json", None, "invalido"),
+    ('{"planos_precos": [{"produto": "A"}, {"prod', None, "invalido"),
+    ("[1, 2]", None, "invalido"),
+])
+def test_recover_json(text, expected, status):
+    assert pipeline.recover_json(text) == (expected, status)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2,]}', '{"a": [1, 2]}'),
+    ('{"a": 1 ,\n}', '{"a": 1 \n}'),
+    ('{"a": "x,]", "b": [1,]}', '{"a": "x,]", "b": [1]}'),
+    ('{"a": "aspas \\" ,}", "b": 2,}', '{"a": "aspas \\" ,}", "b": 2}'),
+    ('{"a": [1, 2]}', '{"a": [1, 2]}'),
+])
+def test_remove_trailing_commas(text, expected):
+    assert pipeline.remove_trailing_commas(text) == expected
+
+
+TRUNCATED = (
+    '{"empresa": "Saúde \\"Boa\\"", "planos_precos": ['
+    '{"produto": "A", "valores_faixas": {"00-18": "R$ 1,00"}}, '
+    '{"produto": "B", "observacoes": "usa } e ] no texto"}, '
+    '{"produto": "C", "valores_fa'
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(TRUNCATED)])
+def test_partial_result_keeps_complete_items_of_truncated_array(chunk_size):
+    seen = []
+    parser = pipeline.StreamingJSONParser(on_item=lambda key, item: seen.append((key, item["produto"])))
+    for start in range(0, len(TRUNCATED), chunk_size):
+        parser.feed(TRUNCATED[start:start + chunk_size])
+    result = parser.partial_result()
+    assert result["empresa"] == 'Saúde "Boa"'
+    assert [p["produto"] for p in result["planos_precos"]] == ["A", "B"]
+    assert result["planos_precos"][0]["valores_faixas"] == {"00-18": "R$ 1,00"}
+    assert seen == [("planos_precos", "A"), ("planos_precos", "B")]
+
+
+@pytest.mark.parametrize("text, expected", [
+    (
+        '{"informacoes_gerais": [{"tipo": "h", "lista": [{"nome": "H1"}, {"nome": "H2"}]}, {"tipo": "c", "lista": [{"nome": "C1"}, {"no',
+        [{"tipo": "h", "lista": [{"nome": "H1"}, {"nome": "H2"}]}, {"lista": [{"nome": "C1"}]}],
+    ),
+    ('{"informacoes_gerais": [{"tipo": "h", "lista": [', None),
+    ('{"tabelas_valores": [{"tipo": "copart", "valores": {"consulta": "R$ 40,00"}}', None),
+])
+def test_partial_result_network_groups(text, expected):
+    parser = pipeline.StreamingJSONParser()
+    parser.feed(text)
+    assert parser.partial_result().get("informacoes_gerais") == expected
+
+
+def test_partial_result_tables():
+    parser = pipeline.StreamingJSONParser()
+    parser.feed('{"tabelas_valores": [{"tipo": "copart", "valores": {"consulta": "R$ 40,00"}}, {"tipo": "x"')
+    assert parser.partial_result() == {"tabelas_valores": [{"tipo": "copart", "valores": {"consulta": "R$ 40,00"}}]}
+
+
+def make_extractor(responses):
+    extractor = pipeline.PDFExtractorAgents(
+        "k", cache=pipeline.ResultCache(db_path=None, memory_items=0), store=pipeline.ResultStore(None),
+        streaming=False, table_fast_path=False
+    )
+    calls = []
+
+    def call_openrouter_api(prompt, model=pipeline.DEFAULT_MODEL, parser=None, routes=None):
+        calls.append(prompt)
+        return responses.pop(0) if responses else ""
+
+    extractor.call_openrouter_api = call_openrouter_api
+    return extractor, calls
+
+
+@pytest.mark.parametrize("responses, stats, produtos, requests", [
+    (["", ""], {"vazio": 1}, [], 1),
+    (["não é json"], {"invalido": 1}, [], 1),
+    (['```json\n{"planos_precos": [{"produto": "A"},]}\n```'], {"reparado": 1}, ["A"], 1),
+    (
+        ['{"planos_precos": [{"produto": "A"}, {"prod', '{"planos_precos": [{"produto": "B"}]}'],
+        {"continuacao": 1, "continuado": 1}, ["A", "B"], 2,
+    ),
+    (
+        ['{"planos_precos": [{"produto": "A"}, {"prod', "", ""],
+        {"continuacao": 1, "recuperado": 1}, ["A"], 2,
+    ),
+])
+def test_agent_parse_status(responses, stats, produtos, requests):
+    extractor, calls = make_extractor(list(responses))
+    result = extractor.agent_valores_completo("=== PÁGINA 1 ===\ntexto")
+    assert extractor.parse_stats == stats
+    assert [p["produto"] for p in result["planos_precos"]] == produtos
+    assert len(calls) == requests
@@ -0,0 +1,78 @@
+import pytest
+
+import pipeline
+
+
+@pytest.mark.parametrize("cell, faixa", [
+    ("00-18", "00-18"),
+    ("0 a 18", "00-18"),
+    ("00 a 18 anos", "00-18"),
+    ("19 – 23", "19-23"),
+    (" 54  até 58 ", "54-58"),
+    ("59+", "59+"),
+    ("59 ou +", "59+"),
+    ("59 anos ou mais", "59+"),
+    ("60+", ""),
+    ("18-23", ""),
+    ("Faixa etária", ""),
+    (None, ""),
+])
+def test_normalize_faixa(cell, faixa):
+    assert pipeline.normalize_faixa(cell) == faixa
+
+
+PRICES = [f"R$ {100 + i * 10},00" for i in range(len(pipeline.FAIXAS_ETARIAS))]
+BANDS = ["0 a 18", "19 a 23", "24 a 28", "29 a 33", "34 a 38", "39 a 43", "44 a 48", "49 a 53", "54 a 58", "59 ou +"]
+
+BANDS_AS_ROWS = [["Faixa", "Plano Enfermaria", "Plano Apartamento"]] + [
+    [band, price, price.replace("R$ 1", "R$ 2")] for band, price in zip(BANDS, PRICES)
+]
+BANDS_AS_COLUMNS = [["Plano"] + BANDS, ["Ambulatorial 123456-7"] + PRICES, [None] * 11, ["Hospitalar Apartamento"] + PRICES]
+
+
+@pytest.mark.parametrize("table, produtos, complete", [
+    (BANDS_AS_ROWS, ["Plano Enfermaria", "Plano Apartamento"], True),
+    (BANDS_AS_COLUMNS, ["Ambulatorial 123456-7", "Hospitalar Apartamento"], True),
+    ([row[:2] for row in BANDS_AS_ROWS[:-1]], ["Plano Enfermaria"], False),
+    ([["Plano"] + BANDS, ["Básico"] + PRICES[:-1] + ["sob consulta"]], ["Básico"], False),
+    ([["Plano", "Valor"], ["Básico", "R$ 10,00"]], [], True),
+    ([[None, None]], [], True),
+])
+def test_parse_price_table(table, produtos, complete):
+    planos, parsed_complete = pipeline.parse_price_table(table, 3, 1, "Tabela PME 02 a 29 vidas")
+    assert [p["produto"] for p in planos] == produtos
+    assert parsed_complete is complete
+
+
+def test_parse_price_table_fields():
+    planos, _ = pipeline.parse_price_table(BANDS_AS_COLUMNS, 3, 2, "Tabela PME 02 a 29 vidas")
+    ambulatorial, hospitalar = planos
+    assert ambulatorial["valores_faixas"] == dict(zip(pipeline.FAIXAS_ETARIAS, PRICES))
+    assert ambulatorial["tipo"] == "Ambulatorial"
+    assert ambulatorial["registro_ans"] == "123456-7"
+    assert hospitalar["tipo"] == "Hospitalar"
+    assert hospitalar["acomodacao"] == "Apartamento"
+    assert {p["categoria"] for p in planos} == {"PME"}
+    assert {p["segmentacao"] for p in planos} == {"02_29_vidas"}
+    assert {p["tabela_origem"] for p in planos} == {"tabela_2_pagina_3"}
+    assert {p["posicao_na_pagina"] for p in planos} == {"página 3"}
+
+
+def test_parse_price_table_ids_are_deterministic():
+    first, _ = pipeline.parse_price_table(BANDS_AS_ROWS, 3, 1)
+    second, _ = pipeline.parse_price_table(BANDS_AS_ROWS, 3, 1)
+    other_page, _ = pipeline.parse_price_table(BANDS_AS_ROWS, 4, 1)
+    assert [p["id"] for p in first] == [p["id"] for p in second]
+    assert len({p["id"] for p in first}) == 2
+    assert not {p["id"] for p in first} & {p["id"] for p in other_page}
+
+
+@pytest.mark.parametrize("tables, produtos, complete", [
+    ([BANDS_AS_ROWS, BANDS_AS_COLUMNS], 4, True),
+    ([BANDS_AS_ROWS, [row[:2] for row in BANDS_AS_ROWS[:-1]]], 0, False),
+    ([], 0, False),
+])
+def test_parse_price_tables(tables, produtos, complete):
+    planos, parsed_complete = pipeline.parse_price_tables(3, "", tables)
+    assert len(planos) == produtos
+    assert parsed_complete is complete